@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+import numpy
+
+class SeriesAggregate(object):
+    """
+    Running mean and variance, over patients, of several time series (e.g.
+    the total and resistant populations) at every time step, updated with
+    Welford's algorithm as each patient's observations arrive. Memory depends
+    on the number and length of the series, not on the number of patients,
+    and aggregates built in different processes can be merged.
+    """
+
+    def __init__(self, numSeries, steps):
+        """
+        Initialization function.
+
+        numSeries: the number of series (an integer)
+
+        steps: the number of time steps of each series (an integer)
+        """
+        self.count = numpy.zeros(steps)
+        self.mean = numpy.zeros((numSeries, steps))
+        self.m2 = numpy.zeros((numSeries, steps))
+
+    def addStep(self, step, values):
+        """
+        Adds one patient's observations at one time step.
+
+        step: the time step (an integer)
+
+        values: the value of each series (a list of numbers)
+        """
+        values = numpy.asarray(values, dtype=float)
+        self.count[step] += 1
+        delta = values - self.mean[:, step]
+        self.mean[:, step] += delta/self.count[step]
+        self.m2[:, step] += delta*(values - self.mean[:, step])
+
+    def add(self, series):
+        """
+        Adds one patient's observations at every time step.
+
+        series: the patient's series (a list of numSeries lists of steps
+        numbers)
+        """
+        values = numpy.asarray(series, dtype=float)
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta/self.count
+        self.m2 += delta*(values - self.mean)
+
+    def merge(self, other):
+        """
+        Adds the observations of another aggregate to this one (Chan et al.'s
+        parallel update).
+
+        other: the aggregate to merge (a SeriesAggregate of the same shape)
+        """
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            share = numpy.where(count > 0, other.count/count, 0)
+            self.mean += delta*share
+            self.m2 += other.m2 + delta**2*self.count*share
+        self.count = count
+
+    def getMean(self):
+        """
+        Returns the mean of every series at every time step (a numSeries x
+        steps numpy array).
+        """
+        return self.mean.copy()
+
+    def getVariance(self):
+        """
+        Returns the sample variance over patients of every series at every time
+        step, 0 where fewer than two patients were observed (a numSeries x
+        steps numpy array).
+        """
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return numpy.where(self.count > 1, self.m2/(self.count - 1), 0.)
+
+    def getStd(self):
+        """
+        Returns the sample standard deviation over patients of every series at
+        every time step (a numSeries x steps numpy array).
+        """
+        return numpy.sqrt(self.getVariance())
+
+    def getConfidence(self, z = 1.96):
+        """
+        Computes a normal confidence band for the mean of every series.
+
+        z: the number of standard errors on each side (a float), 1.96 for 95%
+
+        returns: the lower and upper bounds of the band (a tuple of numSeries x
+        steps numpy arrays)
+        """
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            error = numpy.where(self.count > 0, z*self.getStd()/numpy.sqrt(self.count), 0.)
+        return self.mean - error, self.mean + error
+
+class SeriesSketch(object):
+    """
+    Quantile sketches, over patients, of several time series at every time
+    step. Each sketch counts observations in logarithmic buckets whose width
+    is a fixed fraction of their value, so any quantile is returned within a
+    relative error of accuracy, memory does not depend on the number of
+    patients, and sketches built in different processes merge by adding
+    their counts. Only the non-empty buckets are pickled, so a sketch of a
+    few patients is sent between processes at about the size of their
+    series.
+    """
+
+    def __init__(self, numSeries, steps, accuracy = 0.01, maxValue = 10**5):
+        """
+        Initialization function.
+
+        numSeries: the number of series (an integer)
+
+        steps: the number of time steps of each series (an integer)
+
+        accuracy: the relative error allowed on quantiles (a float)
+
+        maxValue: the largest value that may be added (a number), e.g. the
+        largest population a patient can reach
+        """
+        self.gamma = (1 + accuracy)/(1 - accuracy)
+        self.maxValue = maxValue
+        #bucket 0 holds zero and values below 1, bucket i > 0 holds
+        #values in (gamma**(i - 2), gamma**(i - 1)], so bucket 1 holds 1
+        self.numBuckets = int(numpy.ceil(numpy.log(maxValue)/numpy.log(self.gamma))) + 2
+        self.counts = numpy.zeros((numSeries, steps, self.numBuckets), dtype=numpy.int64)
+
+    def __getstate__(self):
+        #most buckets of a small batch are empty
+        state = dict(self.__dict__)
+        counts = state.pop('counts')
+        state['shape'] = counts.shape
+        state['cells'] = numpy.flatnonzero(counts)
+        state['cellCounts'] = counts.reshape(-1)[state['cells']]
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        self.counts = numpy.zeros(state.pop('shape'), dtype=numpy.int64)
+        self.counts.reshape(-1)[state.pop('cells')] = state.pop('cellCounts')
+        self.__dict__.update(state)
+
+    def getBuckets(self, values):
+        """
+        Finds the bucket of every value.
+
+        values: non-negative values (a numpy array)
+
+        returns: the buckets (a numpy array of integers of the same shape)
+        """
+        with numpy.errstate(divide='ignore'):
+            buckets = numpy.ceil(numpy.log(numpy.maximum(values, 1))/numpy.log(self.gamma)) + 1
+        buckets[values < 1] = 0
+        return buckets.astype(numpy.int64)
+
+    def add(self, series):
+        """
+        Adds one patient's observations at every time step.
+
+        series: the patient's series (a list of numSeries lists of steps
+        numbers, none above maxValue)
+        """
+        values = numpy.asarray(series, dtype=float)
+        if values.max() > self.maxValue:
+            raise ValueError("add(): %g is above maxValue %g" % (values.max(), self.maxValue))
+        buckets = self.getBuckets(values)
+        numSeries, steps = buckets.shape
+        cells = numpy.arange(numSeries*steps).reshape(numSeries, steps)*self.numBuckets
+        self.counts.reshape(-1)[(cells + buckets).ravel()] += 1
+
+    def merge(self, other):
+        """
+        Adds the observations of another sketch to this one.
+
+        other: the sketch to merge (a SeriesSketch built with the same
+        arguments)
+        """
+        self.counts += other.counts
+
+    def getQuantile(self, q):
+        """
+        Estimates a quantile of every series at every time step.
+
+        q: the quantile (a float between 0-1), e.g. 0.5 for the median
+
+        returns: the quantiles (a numSeries x steps numpy array of floats)
+        """
+        cumulative = numpy.cumsum(self.counts, axis=-1)
+        rank = q*(cumulative[..., -1:] - 1)
+        buckets = numpy.argmax(cumulative > rank, axis=-1)
+        #the value in the middle of the bucket, in relative terms
+        values = 2*self.gamma**(buckets - 1)/(self.gamma + 1)
+        return numpy.where(buckets == 0, 0., values)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+import numpy
+from genotype import mutationMatrix
+from meanfield import toGenotypePatient
+from schedule import Schedule
+
+def truncatedProduct(first, second, degree):
+    """
+    Multiplies polynomials row by row, dropping the terms above degree.
+
+    first, second: coefficient arrays, one polynomial per row, lowest degree
+    first (numpy arrays with degree + 1 columns)
+
+    degree: the highest degree kept (an integer)
+
+    returns: the truncated products (a numpy array shaped as first)
+    """
+    return numpy.array([numpy.convolve(a, b)[:degree + 1] for a, b in zip(first, second)])
+
+def truncatedPower(poly, exponent, degree):
+    """
+    Raises a polynomial to a power by repeated squaring, dropping the terms
+    above degree.
+
+    poly: the coefficients, lowest degree first (a numpy array)
+
+    exponent: the power (a non-negative integer)
+
+    degree: the highest degree kept (an integer)
+
+    returns: the coefficients of the truncated power (a numpy array)
+    """
+    result = numpy.zeros(degree + 1)
+    result[0] = 1.
+    while exponent:
+        if exponent & 1:
+            result = numpy.convolve(result, poly)[:degree + 1]
+        poly = numpy.convolve(poly, poly)[:degree + 1]
+        exponent >>= 1
+    return result
+
+class BranchingModel(object):
+    """
+    The low-density approximation of a patient's virus population as a
+    multi-type branching process: every particle of genotype g is cleared with
+    probability clearProb and otherwise, if g resists every drug being
+    administered, has one child with probability birthProb, whose genotype
+    follows the mutation matrix. Particles no longer compete for space, which
+    is close to the treated dynamics once the population has collapsed.
+    """
+
+    def __init__(self, patient, birthProb = None):
+        """
+        Initialization function.
+
+        patient: the starting state and parameters (a GenotypePatient, or a
+        Patient whose viruses are collapsed into one)
+
+        birthProb: the reproduction probability of a resistant particle (a
+        float), or None to use maxBirthProb, which ignores crowding and so
+        never overstates the cure rate
+        """
+        self.patient = toGenotypePatient(patient)
+        self.birthProb = self.patient.maxBirthProb if birthProb is None else birthProb
+        self.transitions = mutationMatrix(self.patient.mutProb, len(self.patient.drugs))
+
+    def getReproducing(self, drugs):
+        """
+        Finds the genotypes that reproduce while drugs are administered.
+
+        drugs: the drugs being administered (an iterable of strings)
+
+        returns: 1 for every genotype resisting all of drugs, 0 otherwise (a
+        numpy array of floats)
+        """
+        mask = self.patient.getMask(drugs)
+        if mask is None:
+            return numpy.zeros(len(self.patient.genotypes))
+        return ((self.patient.genotypes & mask) == mask).astype(float)
+
+    def applyStep(self, pgf, reproducing):
+        """
+        Composes the offspring generating function of one time step with the
+        generating functions pgf, i.e. prepends a step to the process.
+
+        pgf: the generating function of the population size descending from
+        one particle of each genotype (a genotypes x (degree + 1) numpy array)
+
+        reproducing: the genotypes that reproduce during the step (a numpy
+        array from getReproducing())
+
+        returns: the generating functions one step earlier (a numpy array
+        shaped as pgf)
+        """
+        degree = pgf.shape[1] - 1
+        birthProb = (self.birthProb*reproducing)[:, None]
+        children = truncatedProduct(pgf, self.transitions.dot(pgf), degree)
+        survivor = (1 - birthProb)*pgf + birthProb*children
+        result = (1 - self.patient.clearProb)*survivor
+        result[:, 0] += self.patient.clearProb
+        return result
+
+    def getPGF(self, schedule, steps, degree):
+        """
+        Computes the generating function of the population size after steps
+        time steps, descending from one particle of each genotype.
+
+        schedule: the drugs to administer (a Schedule, or a dictionary mapping
+        drug names to the first time step they act on), with steps counted
+        from the patient's current state; drugs already prescribed to the
+        patient act from the first step
+
+        steps: the number of time steps (an integer)
+
+        degree: the highest population size tracked (an integer)
+
+        returns: the coefficients, lowest degree first (a genotypes x
+        (degree + 1) numpy array)
+        """
+        if type(schedule) == dict:
+            schedule = Schedule(schedule)
+        pgf = numpy.zeros((len(self.patient.genotypes), degree + 1))
+        if degree > 0:
+            pgf[:, 1] = 1.
+        for step in xrange(steps, 0, -1):
+            #a drug both prescribed and scheduled counts once
+            drugs = set(schedule.getDrugs(step) + self.patient.getPrescriptions())
+            pgf = self.applyStep(pgf, self.getReproducing(drugs))
+        return pgf
+
+    def getThresholdProb(self, schedule, steps, threshold = 0):
+        """
+        Computes the probability that the patient's virus population is at
+        most threshold after steps time steps, e.g. the share of patients
+        cured (50 particles or fewer) in problem5 and problem6.
+
+        schedule: the drugs to administer (as in getPGF())
+
+        steps: the number of time steps (an integer)
+
+        threshold: the largest population counted (an integer), 0 for the
+        probability of extinction
+
+        returns: the probability (a float)
+        """
+        pgf = self.getPGF(schedule, steps, threshold)
+        total = numpy.zeros(threshold + 1)
+        total[0] = 1.
+        for genotype, count in enumerate(self.patient.counts):
+            if count:
+                total = numpy.convolve(total, truncatedPower(pgf[genotype], int(count), threshold))[:threshold + 1]
+        return total.sum()
+
+    def getExtinctionProb(self, drugs = None, maxSteps = 100000, tolerance = 1e-12):
+        """
+        Computes the probability that the virus population eventually dies
+        out while a fixed set of drugs is administered.
+
+        drugs: the drugs administered (a list of strings), or None for the
+        patient's prescriptions
+
+        maxSteps: the most time steps iterated (an integer)
+
+        tolerance: the change in the extinction probability of every genotype
+        below which the iteration stops (a float)
+
+        returns: the probability (a float)
+        """
+        if drugs is None:
+            drugs = self.patient.getPrescriptions()
+        reproducing = self.getReproducing(drugs)
+        extinct = numpy.zeros((len(self.patient.genotypes), 1))
+        for step in xrange(maxSteps):
+            previous = extinct
+            extinct = self.applyStep(extinct, reproducing)
+            if abs(extinct - previous).max() < tolerance:
+                break
+        return numpy.prod(extinct[:, 0] ** self.patient.counts)
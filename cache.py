@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+import cPickle
+import hashlib
+import os
+
+#bump when the simulation rules or the results change, so results of older
+#code are not reused
+SIMULATION_VERSION = 6
+
+def describePatient(patient):
+    """
+    Describes everything a patient's simulation depends on apart from the
+    random numbers: maxPop, the sampling mode and the number of virus
+    particles of each strain and resistance profile.
+
+    patient: the patient (a Patient)
+
+    returns: the description (a tuple)
+    """
+    strains = {}
+    for virus in patient.viruses:
+        strain = (virus.maxBirthProb, virus.clearProb, virus.mutProb,
+                  tuple(sorted(virus.resistances.items())))
+        strains[strain] = strains.get(strain, 0) + 1
+    return patient.maxPop, patient.skip_sampling, tuple(sorted(strains.items()))
+
+class TrialCache(object):
+    """
+    A cache of trial results on local disk, one pickle file per result. When
+    the files take more than maxBytes, the least recently used are deleted.
+    """
+
+    def __init__(self, directory = '.trialcache', maxBytes = 64 * 2**20):
+        """
+        Initialization function, creates the directory if needed.
+
+        directory: the directory holding the results (a string)
+
+        maxBytes: the most disk space the results may take (an integer)
+        """
+        self.directory = directory
+        self.maxBytes = maxBytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def getKey(self, *parts):
+        """
+        Hashes a description of a trial into a key.
+
+        parts: everything the result depends on, e.g. the trial's name, the
+        patient description from describePatient(), the schedule's change
+        points, the number of patients and the seed (values with a stable
+        repr())
+
+        returns: the key (a string)
+        """
+        return hashlib.sha256(repr((SIMULATION_VERSION,) + parts)).hexdigest()
+
+    def getPath(self, key):
+        """
+        Returns the path of the file holding the result of key.
+        """
+        return os.path.join(self.directory, key + '.pkl')
+
+    def load(self, key):
+        """
+        Loads a result, marking it as recently used.
+
+        key: the key of the result (a string from getKey())
+
+        returns: the result; raises a KeyError if it is not cached
+        """
+        path = self.getPath(key)
+        try:
+            with open(path, 'rb') as f:
+                result = cPickle.load(f)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            raise KeyError(key)
+        os.utime(path, None)
+        return result
+
+    def store(self, key, result):
+        """
+        Saves a result, then evicts the least recently used results until the
+        cache fits in maxBytes.
+
+        key: the key of the result (a string from getKey())
+
+        result: the result (a picklable object)
+        """
+        path = self.getPath(key)
+        #write to a temporary file first so a crash never leaves half a result
+        with open(path + '.tmp', 'wb') as f:
+            cPickle.dump(result, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(path + '.tmp', path)
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes the least recently used results until the cache fits in
+        maxBytes.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                info = os.stat(os.path.join(self.directory, name))
+                entries.append((info.st_mtime, info.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+    def fetch(self, key, trial, *args):
+        """
+        Returns the cached result of key, running trial(*args) and caching its
+        result if there is none.
+
+        key: the key of the result (a string from getKey())
+
+        trial: the function computing the result
+
+        args: the arguments of trial
+
+        returns: the result
+        """
+        try:
+            return self.load(key)
+        except KeyError:
+            result = trial(*args)
+            self.store(key, result)
+            return result
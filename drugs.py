@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+class DrugRegistry(object):
+    """
+    Maps drug names to bit positions so that a set of drugs, or a virus
+    particle's resistance profile, can be stored as a single integer mask.
+    Drugs are registered the first time they are seen and keep their bit for
+    the life of the registry.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty registry.
+        """
+        self.drugs = []
+        self.bits = {}
+        self.bit_tuples = {}
+
+    def getBit(self, drug):
+        """
+        Gets the bit of a drug, registering the drug if it is new.
+
+        drug: the drug (a string)
+
+        returns: the bit representing the drug (an integer power of two)
+        """
+        try:
+            return self.bits[drug]
+        except KeyError:
+            self.bits[drug] = 1 << len(self.drugs)
+            self.drugs.append(drug)
+            return self.bits[drug]
+
+    def getMask(self, drugs):
+        """
+        Encodes drug names as a mask.
+
+        drugs: the drugs (an iterable of strings)
+
+        returns: the mask with the bit of every drug set (an integer)
+        """
+        mask = 0
+        for drug in drugs:
+            mask |= self.getBit(drug)
+        return mask
+
+    def findMask(self, drugs):
+        """
+        Encodes drug names as a mask without registering new drugs, for
+        queries that must not change the registry.
+
+        drugs: the drugs (an iterable of strings)
+
+        returns: the mask with the bit of every drug set (an integer), or
+        None if a drug is not registered, in which case no particle is
+        resistant to all of them
+        """
+        mask = 0
+        for drug in drugs:
+            if drug not in self.bits:
+                return None
+            mask |= self.bits[drug]
+        return mask
+
+    def encode(self, resistances):
+        """
+        Encodes a resistances dictionary as a genotype.
+
+        resistances: A dictionary of drug names (strings) mapping to the state
+        of resistance (either True or False) to each drug.
+
+        returns: the mask of the drugs the profile is resistant to (an integer)
+        """
+        return self.getMask([drug for drug in resistances if resistances[drug]])
+
+    def decode(self, genotype, traits):
+        """
+        Decodes a genotype back into a resistances dictionary.
+
+        genotype: the mask of drugs resisted (an integer)
+
+        traits: the mask of drugs the profile describes (an integer)
+
+        returns: A dictionary of drug names (strings) mapping to the state of
+        resistance (either True or False) to each drug in traits.
+        """
+        return dict((drug, bool(genotype & self.bits[drug]))
+                    for drug in self.getDrugs(traits))
+
+    def getDrugs(self, mask):
+        """
+        Decodes a mask into drug names.
+
+        mask: a mask of registered drugs (an integer)
+
+        returns: the drugs whose bit is set in mask, in bit order (a list of
+        strings)
+        """
+        return [drug for drug in self.drugs if mask & self.bits[drug]]
+
+    def getBits(self, mask):
+        """
+        Splits a mask into its bits. The result is cached so that every
+        particle with the same traits shares one tuple.
+
+        mask: a mask of registered drugs (an integer)
+
+        returns: the bits set in mask, in bit order (a tuple of integers)
+        """
+        try:
+            return self.bit_tuples[mask]
+        except KeyError:
+            bits = tuple(self.bits[drug] for drug in self.getDrugs(mask))
+            self.bit_tuples[mask] = bits
+            return bits
+
+#the registry shared by every virus particle and patient
+registry = DrugRegistry()
@@ -0,0 +1,630 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import numpy
+from drugs import registry
+
+#the matrices built by mutationMatrix(), by mutProb and number of drugs
+mutationMatrices = {}
+
+def mutate(children, mutProb, numDrugs, rng = numpy.random):
+    """
+    Distributes offspring over genotypes. Each resistance trait of every child
+    is switched independently with probability mutProb, exactly as in
+    ResistantVirus.reproduce(). The children of each parent genotype are
+    spread with one multinomial draw over their row of mutationMatrix(), or,
+    when more genotypes have children than there are drugs, every trait is
+    switched with one binomial draw over the whole array, whichever takes
+    fewer draws.
+
+    children: offspring counts indexed by the parent's genotype (a numpy array
+    of integers whose last axis has length 2**numDrugs)
+
+    mutProb: probability of switching each resistance trait (a float)
+
+    numDrugs: the number of drugs in the genotype (an integer)
+
+    rng: the random number generator to draw from (numpy.random, or a Stream)
+
+    returns: offspring counts indexed by the child's genotype (a numpy array
+    with the same shape as children)
+    """
+    if mutProb <= 0 or numDrugs == 0:
+        return children
+    parents = numpy.nonzero(children)
+    if len(parents[0]) <= numDrugs:
+        transitions = mutationMatrix(mutProb, numDrugs)
+        result = numpy.zeros_like(children)
+        for cell in zip(*parents):
+            result[cell[:-1]] += rng.multinomial(children[cell], transitions[cell[-1]])
+        return result
+    genotypes = numpy.arange(children.shape[-1])
+    for bit in xrange(numDrugs):
+        flipped = rng.binomial(children, mutProb)
+        children = children - flipped + flipped[..., genotypes ^ (1 << bit)]
+    return children
+
+def mutationMatrix(mutProb, numDrugs):
+    """
+    Builds the genotype transition matrix of an offspring. Each of the
+    numDrugs resistance traits is switched independently with probability
+    mutProb, as in ResistantVirus.reproduce().
+
+    mutProb: probability of switching each resistance trait (a float)
+
+    numDrugs: the number of drugs in the genotype (an integer)
+
+    returns: the matrix whose entry [g, h] is the probability that the child
+    of a genotype g particle has genotype h (a 2**numDrugs x 2**numDrugs
+    numpy array). It is built once for every mutProb and numDrugs and shared
+    by all callers, so it is read-only.
+    """
+    key = mutProb, numDrugs
+    if key not in mutationMatrices:
+        genotypes = numpy.arange(2 ** numDrugs)
+        switched = genotypes[:, None] ^ genotypes[None, :]
+        flips = sum(((switched >> bit) & 1 for bit in xrange(numDrugs)), numpy.zeros_like(switched))
+        matrix = mutProb ** flips * (1 - mutProb) ** (numDrugs - flips)
+        matrix.setflags(write=False)
+        mutationMatrices[key] = matrix
+    return mutationMatrices[key]
+
+class GenotypePatient(object):
+    """
+    Representation of a patient whose virus population is stored as a count
+    per genotype rather than as a list of ResistantVirus instances. Particles
+    sharing a resistance profile are interchangeable, so each update costs
+    time proportional to the number of genotypes, not to the population.
+
+    Genotype g is resistant to self.drugs[j] if bit j of g is set. The drugs
+    are in registry bit order, and self.masks holds the registry genotype of
+    every g, as used by ResistantVirus and Patient.
+    """
+
+    def __init__(self, viruses, maxPop, rng = numpy.random):
+        """
+        Initialization function, collapses the viruses into genotype counts
+        and saves maxPop. Also initializes the list of drugs being
+        administered (which should initially include no drugs).
+
+        viruses: the list representing the virus population (a non-empty list
+        of ResistantVirus instances sharing maxBirthProb, clearProb, mutProb
+        and the drugs named in their resistances)
+
+        maxPop: the maximum virus population for this patient (an integer)
+
+        rng: the random number generator to draw from (numpy.random, or a
+        Stream owned by this patient)
+        """
+        if type(viruses) != list or not viruses:
+            raise TypeError("GenotypePatient.__init__(): expected non-empty list for type(viruses)")
+        strains = set(virus.strain for virus in viruses)
+        if len(strains) != 1:
+            raise ValueError("GenotypePatient.__init__(): viruses must share one strain")
+        self.maxBirthProb, self.clearProb, self.mutProb, self.traits = strains.pop().getKey()
+        self.drugs = registry.getDrugs(self.traits)
+        self.maxPop = maxPop
+        self.genotypes = numpy.arange(2 ** len(self.drugs))
+        bits = registry.getBits(self.traits)
+        self.masks = numpy.array([sum(bit for j, bit in enumerate(bits) if genotype >> j & 1)
+                                  for genotype in self.genotypes])
+        self.counts = numpy.zeros(len(self.genotypes), dtype=numpy.int64)
+        for virus in viruses:
+            self.counts[self.getGenotype(virus.resistances)] += 1
+        self.drugs_given = []
+        #set when a drug is added, so leap() takes an exact step next
+        self.prescriptions_changed = False
+        #time steps simulated, and the prescription changes of the schedule
+        self.step = 0
+        self.schedule_changes = {}
+        #genotype counts after each step, if recorded, see startHistory()
+        self.history = None
+        self.rng = rng
+
+    def clone(self, rng = None):
+        """
+        Snapshots this patient mid-run. The copy evolves independently of this
+        patient, so a shared stretch of a simulation can be run once and then
+        branched into several treatment schedules.
+
+        rng: the random number generator the copy draws from (numpy.random or
+        a Stream), or None to continue from a copy of this patient's Stream
+        (numpy.random itself is shared)
+
+        returns: the copy of this patient
+        """
+        twin = copy.copy(self)
+        twin.counts = self.counts.copy()
+        twin.drugs_given = self.drugs_given[:]
+        if self.history is not None:
+            twin.history = self.history[:]
+        if rng is None and self.rng is not numpy.random:
+            rng = copy.deepcopy(self.rng)
+        twin.rng = self.rng if rng is None else rng
+        return twin
+
+    def getGenotype(self, resistances):
+        """
+        Encodes a resistances dictionary as a genotype index.
+
+        resistances: a dictionary of drug names (strings) mapping to the state
+        of resistance (either True or False) to each drug
+
+        returns: the genotype (an integer)
+        """
+        return sum(1 << j for j, drug in enumerate(self.drugs) if resistances[drug])
+
+    def getMask(self, drugs):
+        """
+        Encodes a list of drugs as a genotype bit mask.
+
+        drugs: drug names (an iterable of strings), a drug may be listed twice
+
+        returns: the bit mask (an integer), or None if a drug is not part of
+        the genotype, in which case no genotype is resistant to all of them
+        """
+        mask = 0
+        for drug in drugs:
+            if drug not in self.drugs:
+                return None
+            mask |= 1 << self.drugs.index(drug)
+        return mask
+
+    #accessors
+    def getTotalPop(self):
+        """
+        Gets the current total virus population.
+
+        returns: The total virus population (an integer)
+        """
+        return int(self.counts.sum())
+
+    def getPrescriptions(self):
+        """
+        Returns the drugs that are being administered to this patient.
+
+        returns: The list of drug names (strings) being administered to this
+        patient.
+        """
+        return self.drugs_given
+
+    def getResistPop(self, drugResist):
+        """
+        Get the population of virus particles resistant to the drugs listed in
+        drugResist.
+
+        drugResist: Which drug resistances to include in the population (a list
+        of strings - e.g. ['guttagonol'] or ['guttagonol', 'grimpex'])
+
+        returns: the population of viruses (an integer) with resistances to all
+        drugs in the drugResist list.
+        """
+        if type(drugResist) != list:
+            raise TypeError("getResistPop():expected list for type(drugResist)")
+        mask = self.getMask(drugResist)
+        #as in Patient, an empty drugResist list selects no virus particles
+        if mask is None or not drugResist:
+            return 0
+        return int(self.counts[(self.genotypes & mask) == mask].sum())
+
+    def startHistory(self):
+        """
+        Starts recording the genotype counts after every update() and leap,
+        from the current state on, so that resistance queries can be answered
+        after the run with getHistoryPop() instead of at every step.
+        """
+        self.history = []
+        self.recordCounts()
+
+    def recordCounts(self):
+        """
+        Appends the current time step and genotype counts to the history.
+        """
+        self.history.append((self.step, self.counts.copy()))
+
+    def getHistory(self):
+        """
+        Gets the recorded history, see startHistory(). A leap is recorded as
+        a single step.
+
+        returns: the time steps recorded (a numpy array of integers), and the
+        genotype counts at those steps, with the genotype axis indexed by
+        registry genotype as in Patient.getHistory() (a numpy array of shape
+        steps x genotypes, or steps x patients x genotypes for a Cohort)
+        """
+        counts = numpy.array([counts for step, counts in self.history])
+        registered = numpy.zeros(counts.shape[:-1] + (2 ** self.traits.bit_length(),), dtype=counts.dtype)
+        registered[..., self.masks] = counts
+        return numpy.array([step for step, counts in self.history]), registered
+
+    def getHistoryPop(self, resistant = [], susceptible = []):
+        """
+        Gets the recorded population of virus particles resistant to every
+        drug in resistant and to none of the drugs in susceptible, as
+        Patient.getHistoryPop().
+
+        resistant: the drugs resisted (a list of strings)
+
+        susceptible: the drugs not resisted (a list of strings)
+
+        returns: the population at every recorded time step (a numpy array of
+        integers, of shape steps x patients for a Cohort)
+        """
+        counts = numpy.array([counts for step, counts in self.history])
+        mask = self.getMask(resistant)
+        #no genotype resists a drug that is not part of the genotype
+        excluded = self.getMask([drug for drug in susceptible if drug in self.drugs])
+        if mask is None:
+            return counts[..., 0]*0
+        selected = ((self.genotypes & mask) == mask) & ((self.genotypes & excluded) == 0)
+        return counts[..., selected].sum(axis=-1)
+
+    def addPrescription(self, newDrug):
+        """
+        Administer a drug to this patient. After a prescription is added, the
+        drug acts on the virus population for all subsequent time steps. If the
+        newDrug is already prescribed to this patient, the method has no effect.
+
+        newDrug: The name of the drug to administer to the patient (a string).
+
+        postcondition: list of drugs being administered to a patient is updated
+        """
+        if type(newDrug) != str:
+            raise TypeError("addPrescription():expected string for type(newDrug)")
+        if newDrug not in self.drugs_given:
+            self.drugs_given.append(newDrug)
+            self.prescriptions_changed = True
+
+    def setPrescriptions(self, drugs):
+        """
+        Replaces the drugs administered to this patient.
+
+        drugs: the names of the drugs to administer (a list of strings)
+        """
+        if sorted(drugs) != sorted(self.drugs_given):
+            self.drugs_given = list(drugs)
+            self.prescriptions_changed = True
+
+    def setSchedule(self, schedule):
+        """
+        Has this patient follow a treatment schedule, as Patient.setSchedule().
+
+        schedule: the treatment schedule (a Schedule)
+        """
+        self.schedule_changes = schedule.getChanges()
+
+    def followSchedule(self):
+        """
+        Counts a time step, switching prescriptions if the schedule changes at
+        this step.
+        """
+        self.step += 1
+        if self.step in self.schedule_changes:
+            self.setPrescriptions(self.schedule_changes[self.step])
+
+    def getStepsToChange(self):
+        """
+        Counts the time steps that can be taken before the schedule next
+        changes the prescriptions.
+
+        returns: the number of time steps (an integer), or None if the
+        schedule has no further change
+        """
+        later = [step for step in self.schedule_changes if step > self.step]
+        if not later:
+            return None
+        return min(later) - self.step - 1
+
+    def update(self):
+        """
+        Update the state of the virus population in this patient for a single
+        time step, following the same rules as Patient.update():
+
+        - Each genotype loses a binomial number of cleared particles.
+
+        - The population density is calculated from the survivors.
+
+        - Survivors resistant to every prescribed drug give birth to a
+          binomial number of offspring, which are then mutated.
+
+        returns: the total virus population at the end of the update (an
+        integer)
+        """
+        self.followSchedule()
+        #an extinct population stays extinct
+        if self.counts.any():
+            self.counts = self.advance(self.counts)
+        if self.history is not None:
+            self.recordCounts()
+        return self.getTotalPop()
+
+    def advance(self, counts):
+        """
+        Computes the genotype counts one time step after counts, as described
+        in update().
+
+        counts: genotype counts (a numpy array whose last axis is indexed by
+        genotype)
+
+        returns: the new genotype counts (a numpy array of the same shape)
+        """
+        counts = counts - self.rng.binomial(counts, self.clearProb)
+        popDensity = counts.sum(axis=-1)/float(self.maxPop)
+        birthProb = numpy.clip(self.maxBirthProb * (1 - popDensity), 0, 1)
+        mask = self.getMask(self.drugs_given)
+        if mask is not None:
+            parents = counts * ((self.genotypes & mask) == mask)
+            children = self.rng.binomial(parents, numpy.expand_dims(birthProb, -1))
+            counts = counts + mutate(children, self.mutProb, len(self.drugs), self.rng)
+        return counts
+
+    def leap(self, steps, tolerance = 0.03, minPop = 100):
+        """
+        Advances the virus population by steps time steps, leaping over several
+        steps at a time (tau leaping). During a leap the population density is
+        frozen at its value at the start of the leap, so every genotype grows
+        as an independent branching process whose mean and variance after the
+        leap are known exactly. The length of a leap is chosen so that the
+        birth probability, which depends on the density, is not expected to
+        drift by more than tolerance (relative) over the leap. Leaps are
+        decided per patient: patients below minPop, or that cannot leap, are
+        stepped exactly alongside the patients that leap. Exact single steps
+        (update()) are taken when no patient can leap, for the first step
+        after a prescription is added and for the steps where the schedule
+        changes the prescriptions.
+
+        steps: the number of time steps to advance (an integer)
+
+        tolerance: the relative change allowed during a leap (a float)
+
+        minPop: the population below which exact steps are taken, and the
+        genotype count below which a genotype is stepped exactly inside a
+        leap (an integer)
+
+        returns: the total virus population at the end of the steps, as
+        update()
+        """
+        while steps > 0:
+            tau = 1
+            #a leap stops short of the next change of the schedule
+            unchanged = self.getStepsToChange()
+            if unchanged is None:
+                unchanged = steps
+            if not self.prescriptions_changed and unchanged != 0:
+                sizes = self.getLeapSize(tolerance, minPop)
+                leaping = sizes > 1
+                if leaping.any():
+                    tau = int(min(sizes[leaping].min(), steps, unchanged))
+            if tau == 1:
+                self.update()
+            else:
+                self.counts = self.leapRows(self.counts, leaping, tau, minPop)
+                self.step += tau
+                if self.history is not None:
+                    self.recordCounts()
+            self.prescriptions_changed = False
+            steps -= tau
+        return self.getTotalPop()
+
+    def leapRows(self, counts, leaping, tau, minPop):
+        """
+        Advances the patients that leap with leapCounts() and the others with
+        tau exact steps (advance()), see leap().
+
+        counts: genotype counts (a numpy array whose last axis is indexed by
+        genotype)
+
+        leaping: whether each patient leaps (a numpy array of booleans, of the
+        shape of counts without its last axis)
+
+        tau: the number of time steps (an integer)
+
+        minPop: see leapCounts()
+
+        returns: the new genotype counts (a numpy array of the same shape)
+        """
+        if leaping.all():
+            return self.leapCounts(counts, tau, minPop)
+        counts = counts.copy()
+        counts[leaping] = self.leapCounts(counts[leaping], tau, minPop)
+        #extinct patients stay extinct
+        exact = ~leaping & counts.any(axis=-1)
+        if exact.any():
+            rows = counts[exact]
+            for step in xrange(tau):
+                rows = self.advance(rows)
+            counts[exact] = rows
+        return counts
+
+    def getLeapProbs(self, counts):
+        """
+        Computes the probabilities frozen over a leap starting from counts.
+
+        counts: genotype counts (a numpy array whose last axis is indexed by
+        genotype)
+
+        returns: a tuple of the expected population density after clearance
+        and the birth probability (numpy arrays, one value per patient), and
+        whether each genotype may reproduce under the prescriptions (a numpy
+        array of booleans indexed by genotype)
+        """
+        density = counts.sum(axis=-1)*(1 - self.clearProb)/self.maxPop
+        birthProb = numpy.clip(self.maxBirthProb * (1 - density), 0, 1)
+        mask = self.getMask(self.drugs_given)
+        if mask is None:
+            return density, birthProb, numpy.zeros(len(self.genotypes), dtype=bool)
+        return density, birthProb, (self.genotypes & mask) == mask
+
+    def getLeapSize(self, tolerance, minPop):
+        """
+        Chooses the number of time steps the next leap of every patient may
+        cover, see leap().
+
+        tolerance: the relative drift of the birth probability allowed during
+        the leap (a float)
+
+        minPop: the population below which exact steps are taken (an integer)
+
+        returns: the number of time steps of every patient (a numpy array of
+        integers, of the shape of self.counts without its last axis; 1 for an
+        exact step)
+        """
+        totals = self.counts.sum(axis=-1).astype(float)
+        large = totals >= minPop
+        if not large.any():
+            return numpy.ones(totals.shape, dtype=int)
+        density, birthProb, reproducing = self.getLeapProbs(self.counts)
+        with numpy.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            parents = self.counts[..., reproducing].sum(axis=-1)
+            births = birthProb*parents/totals
+            #mean and variance of the offspring (itself included) of a particle
+            growth = (1 - self.clearProb)*(1 + births)
+            variance = (1 - self.clearProb)*(1 + 3*births) - growth**2
+            #the mean after a leap is exact, only the birth probability frozen
+            #at its start drifts: a relative change of the population changes
+            #it density/(1 - density) times as much
+            sensitivity = numpy.where(parents > 0, density/(1 - density), 0)
+            change = tolerance/sensitivity
+            #the reproducing and the other genotypes grow at different rates,
+            #the faster of the two bounds the change of the population
+            survival = numpy.log1p(-self.clearProb)
+            rising = numpy.where(parents > 0, numpy.abs(survival + numpy.log1p(birthProb)), 0)
+            falling = numpy.where(parents < totals, -survival, 0)
+            rate = numpy.maximum(rising, falling)
+            #steps until the expected population, or its noise, moves by change
+            drift = numpy.log1p(change)/rate
+            noise = change**2*totals/variance
+            tau = numpy.where(large, numpy.minimum(drift, noise), 1)
+        return numpy.clip(numpy.nan_to_num(tau), 1, 2**30).astype(int)
+
+    def leapCounts(self, counts, tau, minPop):
+        """
+        Computes the genotype counts tau time steps after counts, with the
+        population density frozen over the whole leap. Genotypes with at least
+        minPop particles jump straight to a normal approximation of their
+        branching process after tau steps; smaller genotypes are stepped
+        exactly. Offspring born during the leap are mutated at its end.
+
+        counts: genotype counts (a numpy array whose last axis is indexed by
+        genotype)
+
+        tau: the number of time steps of the leap (an integer)
+
+        minPop: the genotype count from which a genotype is approximated (an
+        integer)
+
+        returns: the new genotype counts (a numpy array of the same shape)
+        """
+        density, birthProb, reproducing = self.getLeapProbs(counts)
+        birthProb = numpy.expand_dims(birthProb, -1)
+        small = numpy.where(counts < minPop, counts, 0)
+        large = counts - small
+        births = numpy.zeros_like(counts)
+        for step in xrange(tau):
+            small = small - self.rng.binomial(small, self.clearProb)
+            children = self.rng.binomial(small * reproducing, birthProb)
+            small = small + children
+            births = births + children
+        #mean and variance of a particle's offspring per step, then of its
+        #descendants after tau steps
+        birthProb = birthProb*reproducing
+        growth = (1 - self.clearProb)*(1 + birthProb)
+        variance = (1 - self.clearProb)*(1 + 3*birthProb) - growth**2
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            generations = numpy.where(numpy.abs(growth - 1) < 1e-12, tau,
+                                      (growth**tau - 1)/(growth - 1))
+        mean = large*growth**tau
+        spread = numpy.sqrt(large*variance*growth**(tau - 1)*generations)
+        descendants = numpy.maximum(0, numpy.rint(self.rng.normal(mean, spread))).astype(counts.dtype)
+        births = births + self.rng.poisson(large*(1 - self.clearProb)*birthProb*generations)
+        mutants = mutate(births, self.mutProb, len(self.drugs), self.rng) - births
+        #a mutant is born during the leap, not at its end: scale it by the
+        #expected growth of its genotype over the rest of the leap, with birth
+        #times weighted like the births of its (reproducing) parent
+        survival = 1 - self.clearProb
+        rising = survival*(1 + birthProb.max(axis=-1, keepdims=True))
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            spawned = numpy.where(numpy.abs(rising - 1) < 1e-12, tau,
+                                  (rising**tau - 1)/(rising - 1))
+            parentGrowth = tau*rising**(tau - 1)/spawned
+            later = numpy.where(reproducing, parentGrowth,
+                                (rising**tau - survival**tau)/(rising - survival)/spawned)
+        later = numpy.where(numpy.isfinite(later), later, 1)
+        parentGrowth = numpy.where(numpy.isfinite(parentGrowth), parentGrowth, 1)
+        gained = self.rng.poisson(numpy.maximum(0, mutants)*later)
+        lost = numpy.rint(numpy.maximum(0, -mutants)*parentGrowth).astype(counts.dtype)
+        return numpy.maximum(0, small + descendants + gained - lost)
+
+class Cohort(GenotypePatient):
+    """
+    Representation of a group of identical, independent patients advanced
+    together. The population is a (patients x genotypes) count matrix, so a
+    single vectorized update steps every patient at once. All patients share
+    the same prescriptions.
+    """
+
+    def __init__(self, viruses, maxPop, numPatients, rng = numpy.random):
+        """
+        Initialization function, gives each of numPatients patients the virus
+        population described by viruses.
+
+        viruses: the list representing the virus population of each patient
+        (a non-empty list of ResistantVirus instances, see GenotypePatient)
+
+        maxPop: the maximum virus population for each patient (an integer)
+
+        numPatients: the number of patients in the cohort (an integer)
+
+        rng: the random number generator to draw from (numpy.random, or a
+        Stream)
+        """
+        GenotypePatient.__init__(self, viruses, maxPop, rng)
+        self.counts = numpy.tile(self.counts, (numPatients, 1))
+
+    #accessors
+    def getTotalPop(self):
+        """
+        Gets the current total virus population of every patient.
+
+        returns: The total virus populations (a numpy array of integers, one
+        per patient)
+        """
+        return self.counts.sum(axis=1)
+
+    def getResistPop(self, drugResist):
+        """
+        Get the population of virus particles resistant to the drugs listed in
+        drugResist for every patient.
+
+        drugResist: Which drug resistances to include in the population (a list
+        of strings - e.g. ['guttagonol'] or ['guttagonol', 'grimpex'])
+
+        returns: the populations of viruses (a numpy array of integers, one
+        per patient) with resistances to all drugs in the drugResist list.
+        """
+        if type(drugResist) != list:
+            raise TypeError("getResistPop():expected list for type(drugResist)")
+        mask = self.getMask(drugResist)
+        #as in Patient, an empty drugResist list selects no virus particles
+        if mask is None or not drugResist:
+            return numpy.zeros(len(self.counts), dtype=numpy.int64)
+        return self.counts[:, (self.genotypes & mask) == mask].sum(axis=1)
+
+    def update(self):
+        """
+        Update the state of the virus population of every patient for a single
+        time step, see GenotypePatient.update(). Patients whose population is
+        extinct are skipped.
+
+        returns: the total virus populations at the end of the update (a numpy
+        array of integers, one per patient)
+        """
+        self.followSchedule()
+        alive = self.counts.any(axis=1)
+        if alive.all():
+            self.counts = self.advance(self.counts)
+        elif alive.any():
+            self.counts[alive] = self.advance(self.counts[alive])
+        if self.history is not None:
+            self.recordCounts()
+        return self.getTotalPop()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import numpy
+
+def binomialMatrix(sizes, probs, numStates, logFactorials):
+    """
+    Tabulates binomial probability mass functions, one row per trial count.
+
+    sizes: the number of trials of each row (a numpy array of integers)
+
+    probs: the success probability of each row (a numpy array of floats)
+
+    numStates: the number of columns, i.e. successes 0..numStates - 1 (an
+    integer)
+
+    logFactorials: log(i!) for i in 0..max(sizes) (a numpy array of floats)
+
+    returns: the matrix whose entry [i, k] is the probability of k successes
+    in sizes[i] trials (a len(sizes) x numStates numpy array)
+    """
+    n = sizes[:, None]
+    p = numpy.clip(probs, 0, 1)[:, None]
+    k = numpy.arange(numStates)[None, :]
+    valid = k <= n
+    failures = numpy.where(valid, n - k, 0)
+    successes = numpy.where(valid, k, 0)
+    with numpy.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        logPmf = (logFactorials[n] - logFactorials[successes] - logFactorials[failures]
+                  + numpy.where(successes > 0, successes*numpy.log(p), 0)
+                  + numpy.where(failures > 0, failures*numpy.log1p(-p), 0))
+        return numpy.where(valid, numpy.exp(logPmf), 0)
+
+class ExactPatient(object):
+    """
+    The exact distribution of the virus population of a SimplePatient. The
+    patient has a single genotype, so its state is the population alone, which
+    never exceeds max(initial population, 2 * maxPop). update() propagates the
+    probability of every population size through one clear-then-reproduce
+    step instead of sampling it.
+    """
+
+    def __init__(self, maxBirthProb, clearProb, maxPop, initialPop):
+        """
+        Initialization function, builds the transition kernel, which is shared
+        by every time step.
+
+        maxBirthProb: Maximum reproduction probability (a float between 0-1)
+
+        clearProb: Maximum clearance probability (a float between 0-1)
+
+        maxPop: the maximum virus population for this patient (an integer)
+
+        initialPop: the starting virus population (an integer)
+        """
+        self.maxBirthProb = maxBirthProb
+        self.clearProb = clearProb
+        self.maxPop = maxPop
+        numStates = max(initialPop, 2*maxPop) + 1
+        states = numpy.arange(numStates)
+        logFactorials = numpy.concatenate(([0.], numpy.cumsum(numpy.log(states[1:]))))
+        #clearance: row n is the distribution of survivors out of n particles
+        self.survival = binomialMatrix(states, numpy.repeat(1. - clearProb, numStates),
+                                       numStates, logFactorials)
+        #reproduction: row m is the distribution of m survivors plus offspring
+        birthProbs = maxBirthProb*(1 - states/float(maxPop))
+        births = binomialMatrix(states, birthProbs, numStates, logFactorials)
+        self.growth = numpy.zeros((numStates, numStates))
+        for m in xrange(numStates):
+            self.growth[m, m:] = births[m, :numStates - m]
+        self.distribution = numpy.zeros(numStates)
+        self.distribution[initialPop] = 1.
+
+    def update(self):
+        """
+        Propagates the distribution of the virus population through a single
+        time step.
+
+        returns: the expected virus population at the end of the update (a
+        float)
+        """
+        self.distribution = self.distribution.dot(self.survival).dot(self.growth)
+        return self.getMean()
+
+    def getDistribution(self):
+        """
+        Gets the current distribution of the virus population.
+
+        returns: the probability of each population size, indexed by size (a
+        numpy array of floats)
+        """
+        return self.distribution
+
+    def getMean(self):
+        """
+        Gets the expected virus population.
+
+        returns: the mean population (a float)
+        """
+        return self.distribution.dot(numpy.arange(len(self.distribution)))
+
+    def getQuantiles(self, quantiles):
+        """
+        Gets quantiles of the virus population.
+
+        quantiles: the quantiles wanted (a list of floats between 0-1)
+
+        returns: the smallest population size whose cumulative probability
+        reaches each quantile (a list of integers)
+        """
+        cumulative = numpy.cumsum(self.distribution)
+        return [int(min(numpy.searchsorted(cumulative, q - 1e-12), len(cumulative) - 1))
+                for q in quantiles]
+
+def exactTrial(maxBirthProb, clearProb, maxPop, initialPop, steps, quantiles = None):
+    """
+    Computes the exact course of a SimplePatient's virus population, in place
+    of averaging many Monte Carlo runs of problem2(). The clearance
+    probability is clearProb as documented by SimpleVirus.doesClear().
+
+    maxBirthProb: Maximum reproduction probability (a float between 0-1)
+
+    clearProb: Maximum clearance probability (a float between 0-1)
+
+    maxPop: the maximum virus population for this patient (an integer)
+
+    initialPop: the starting virus population (an integer)
+
+    steps: the number of time steps to run (an integer)
+
+    quantiles: the quantiles to report at each step (a list of floats), or
+    None to report the whole distribution
+
+    returns: one row per time step starting with the initial state (a numpy
+    array), holding the distribution over population sizes, or the quantiles
+    if they are given; and the expected population at each step (a numpy
+    array of floats)
+    """
+    patient = ExactPatient(maxBirthProb, clearProb, maxPop, initialPop)
+    means = [patient.getMean()]
+    rows = [patient.getQuantiles(quantiles) if quantiles else patient.getDistribution()]
+    for step in xrange(steps):
+        means.append(patient.update())
+        rows.append(patient.getQuantiles(quantiles) if quantiles else patient.getDistribution())
+    return numpy.array(rows), numpy.array(means)
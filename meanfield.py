@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import numpy
+from genotype import GenotypePatient, mutationMatrix
+from schedule import Schedule
+
+def toGenotypePatient(patient):
+    """
+    Collapses a Patient into a GenotypePatient with the same parameters,
+    population and prescriptions. A GenotypePatient is returned unchanged.
+
+    patient: the patient (a Patient or GenotypePatient)
+
+    returns: the patient (a GenotypePatient)
+    """
+    if isinstance(patient, GenotypePatient):
+        return patient
+    collapsed = GenotypePatient(patient.viruses, patient.maxPop)
+    for drug in patient.getPrescriptions():
+        collapsed.addPrescription(drug)
+    return collapsed
+
+def meanField(patient, schedule, steps):
+    """
+    Integrates the deterministic mean-field approximation of a patient's
+    virus population: every stochastic draw of update() is replaced by its
+    expected value, with the same maxBirthProb, clearProb, mutProb and drug
+    blocking rules. This gives a cheap estimate of the expected trajectory of
+    each genotype before committing a schedule to stochastic trials. Rare
+    genotypes never die out here, so once a resistant mutant has to emerge
+    from a handful of particles the estimate is an upper bound on the
+    stochastic mean rather than a prediction of it.
+
+    patient: the starting state and parameters (a GenotypePatient, or a
+    Patient whose viruses are collapsed into one)
+
+    schedule: the drugs to administer (a Schedule, or a dictionary mapping
+    drug names to the first time step they act on, e.g. {'guttagonol':150,
+    'grimpex':225}); drugs already prescribed to the patient act from the
+    first step
+
+    steps: the number of time steps to integrate (an integer)
+
+    returns: the expected population of each genotype, one row per time step
+    starting with the initial state (a (steps + 1) x genotypes numpy array,
+    whose columns are ordered as patient.genotypes)
+    """
+    patient = toGenotypePatient(patient)
+    if type(schedule) == dict:
+        schedule = Schedule(schedule)
+    transitions = mutationMatrix(patient.mutProb, len(patient.drugs))
+    counts = patient.counts.astype(float)
+    series = [counts]
+    for step in xrange(1, steps + 1):
+        #a drug both prescribed and scheduled counts once
+        drugs = set(schedule.getDrugs(step) + patient.getPrescriptions())
+        mask = patient.getMask(drugs)
+        counts = counts*(1 - patient.clearProb)
+        birthProb = min(max(patient.maxBirthProb*(1 - counts.sum()/patient.maxPop), 0), 1)
+        if mask is not None:
+            children = counts*((patient.genotypes & mask) == mask)*birthProb
+            counts = counts + numpy.dot(children, transitions)
+        series.append(counts)
+    return numpy.array(series)
+
+def meanFieldResistPop(patient, series, drugResist):
+    """
+    Reads the expected population resistant to drugResist out of a series
+    returned by meanField(), as getResistPop() does for a single state.
+
+    patient: the patient given to meanField()
+
+    series: the series returned by meanField() (a numpy array)
+
+    drugResist: Which drug resistances to include in the population (a list
+    of strings - e.g. ['guttagonol'] or ['guttagonol', 'grimpex'])
+
+    returns: the expected resistant population at each time step (a numpy
+    array of floats)
+    """
+    patient = toGenotypePatient(patient)
+    mask = patient.getMask(drugResist)
+    if mask is None or not drugResist:
+        return numpy.zeros(len(series))
+    return series[:, (patient.genotypes & mask) == mask].sum(axis=1)
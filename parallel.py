@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import random
+import numpy
+from streams import streamSeed
+
+def runSeededTrial(task):
+    """
+    Runs one trial, first seeding the random and numpy.random generators if
+    the task has a seed, so the result only depends on the task and not on
+    the process running it.
+
+    task: a (trial, args, seed) tuple, where trial is a module level function,
+    args is a tuple of its arguments and seed is an integer or None
+
+    returns: the result of trial(*args)
+    """
+    trial, args, seed = task
+    if seed is not None:
+        random.seed(seed)
+        numpy.random.seed(seed)
+    return trial(*args)
+
+def runTrials(trial, argsList, workers = 1, seed = None):
+    """
+    Runs independent trials over a pool of worker processes. Results are
+    returned in the order of argsList, so as long as every trial draws from a
+    Stream passed in its arguments, or seed is given, the output is the same
+    whatever the number of workers.
+
+    trial: the function simulating one trial (a module level function, so it
+    can be sent to the workers)
+
+    argsList: the arguments of each trial (a list of tuples)
+
+    workers: the number of worker processes (an integer), 1 runs the trials
+    in this process
+
+    seed: the seed of the sweep (an integer), used to seed the global
+    generators of trial i from streamSeed(seed, i), or None to leave the
+    global generators alone
+
+    returns: the result of each trial (a list)
+    """
+    tasks = [(trial, args, None if seed is None else streamSeed(seed, i) % 2**32)
+             for i, args in enumerate(argsList)]
+    if workers == 1:
+        return map(runSeededTrial, tasks)
+    pool = multiprocessing.Pool(workers)
+    try:
+        return pool.map(runSeededTrial, tasks)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+
+def getPyplot():
+    """
+    Imports pyplot, with the ggplot style of the problem set figures. Only
+    the functions that draw figures call this, so importing the simulation
+    (e.g. in worker processes) never loads matplotlib.
+
+    returns: the matplotlib.pyplot module
+    """
+    from matplotlib import pyplot
+    from matplotlib import style
+    style.use('ggplot')
+    return pyplot
@@ -12,7 +12,6 @@ Created on Wed Jun 07 14:56:27 2017
 
 import numpy
 import random
-import pylab
 
 class NoChildException(Exception):
     """
@@ -143,18 +142,23 @@ class SimplePatient(object):
         """
         # TODO    
         #survive or die, for each virus
-        #use anonymous copy to correctly mutate the list
-        for virus in self.viruses[:]:
-            if virus.doesClear(): self.viruses.remove(virus)
+        #move the survivors to the front of the list, in place
+        survivors = 0
+        for virus in self.viruses:
+            if not virus.doesClear():
+                self.viruses[survivors] = virus
+                survivors += 1
+        del self.viruses[survivors:]
         
         #calculate population density
         #ratio of virus population to maximum virus population
         popDensity = self.getTotalPop()/float(self.maxPop)
         
         #reproduce or no?
-        for virus in self.viruses[:]:
+        #only the survivors, not the children appended behind them
+        for i in xrange(survivors):
             try:
-                self.viruses.append(virus.reproduce(popDensity))
+                self.viruses.append(self.viruses[i].reproduce(popDensity))
             except NoChildException: continue
         #return the new population
         return self.getTotalPop()
@@ -10,7 +10,6 @@ Created on Wed Jun 07 17:13:12 2017
 # Collaborators:
 # Time:
 
-from matplotlib import pyplot
 import numpy
 import random
 
@@ -126,12 +125,18 @@ class SimplePatient(object):
         integer)
         """
         # TODO    
-        for virus in self.viruses[:]:
-            if virus.doesClear(): self.viruses.remove(virus)
+        #move the survivors to the front of the list, in place
+        survivors = 0
+        for virus in self.viruses:
+            if not virus.doesClear():
+                self.viruses[survivors] = virus
+                survivors += 1
+        del self.viruses[survivors:]
         popDensity = self.getTotalPop()/float(self.maxPop)
-        for virus in self.viruses[:]:
+        #only the survivors, not the children appended behind them
+        for i in xrange(survivors):
             try:
-                self.viruses.append(virus.reproduce(popDensity))
+                self.viruses.append(self.viruses[i].reproduce(popDensity))
             except NoChildException: continue
         return self.getTotalPop()
 
@@ -154,6 +159,8 @@ def problem2():
     total virus population as a function of time.    
     """
     # TODO
+    #pyplot is only loaded when a figure is drawn
+    from matplotlib import pyplot
     #create a patient with 100 virus particles
     maxPop,maxBirthProb,clearProb = 1000,0.1,0.05
     viruses = [SimpleVirus(maxBirthProb,clearProb)]*100
@@ -174,7 +181,8 @@ def problem2():
     pyplot.xlabel("Time(t)")
     pyplot.ylabel("Virus Population")
 
-problem2()
+if __name__ == '__main__':
+    problem2()
 #
 #for pop in problem2():
 #    print pop
\ No newline at end of file
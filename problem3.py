@@ -10,7 +10,6 @@ Created on Thu Jun 08 12:25:58 2017
 # Collaborators:
 # Time:
 
-from matplotlib import pyplot
 import numpy
 import random
 
@@ -5,13 +5,9 @@ Created on Thu Jun 08 16:21:36 2017
 @author: dmatt
 """
 
-from matplotlib import pyplot
-from matplotlib import style
-
 import numpy
 import random
 
-style.use('ggplot')
 class NoChildException(Exception):
     """
     NoChildException is raised by the reproduce() method in the SimpleVirus
@@ -372,6 +368,10 @@ def problem4():
     vs. time are plotted
     """
     # TODO
+    #pyplot is only loaded when a figure is drawn
+    from matplotlib import pyplot
+    from matplotlib import style
+    style.use('ggplot')
     maxPop = 1000
     maxBirthProb,clearProb,mutProb = 0.1,0.05,0.005
     resistances = {'guttagonol':False}
@@ -398,7 +398,9 @@ def problem4():
     pyplot.show()
     print PatientZero.getTotalPop(),
     print PatientZero.getResistPop(resistances.keys())
-problem4()
+
+if __name__ == '__main__':
+    problem4()
 
 
 
@@ -5,357 +5,97 @@ Created on Fri Jun 09 20:19:11 2017
 @author: dmatt
 """
 
-from matplotlib import pyplot
-from matplotlib import style
 import time
+import multiprocessing
 import numpy
 import random
+from genotype import Cohort
+from parallel import runTrials
+from streams import Stream, streamSeed
+from schedule import Schedule
+from cache import TrialCache, describePatient
+from plotting import getPyplot
+from simulation import NoChildException, SimpleVirus, SimplePatient, ResistantVirus, Patient
 
-style.use('ggplot')
-class NoChildException(Exception):
-    """
-    NoChildException is raised by the reproduce() method in the SimpleVirus
-    and ResistantVirus classes to indicate that a virus particle does not
-    reproduce. You can use NoChildException as is, you do not need to
-    modify/add any code.
-    """    
-
-class SimpleVirus(object):
-    """
-    Representation of a simple virus (does not model drug effects/resistance).
-    """
-    
-    def __init__(self, maxBirthProb, clearProb):
-        """
-        Initialize a SimpleVirus instance, saves all parameters as attributes
-        of the instance.        
-        
-        maxBirthProb: Maximum reproduction probability (a float between 0-1)        
-        
-        clearProb: Maximum clearance probability (a float between 0-1).
-        """
-        # TODO
-        if not 0 < maxBirthProb < 1 and 0 < clearProb < 1:
-            raise ValueError("value should be between 0 and 1")
-        self.maxBirthProb = float(maxBirthProb)
-        self.clearProb = float(clearProb)
-    
-    def doesClear(self):
-        """
-        Stochastically determines whether this virus is cleared from the
-        patient's body at a time step. 
-
-        returns: Using a random number generator (random.random()), this method
-        returns True with probability self.clearProb and otherwise returns
-        False.
-        """
-        # TODO
-        return abs(random.random() - self.clearProb) < 0.01
-    
-    def reproduce(self, popDensity):
-        """
-        Stochastically determines whether this virus particle reproduces at a
-        time step. Called by the update() method in the SimplePatient and
-        Patient classes. The virus particle reproduces with probability
-        self.maxBirthProb * (1 - popDensity).
-        
-        If this virus particle reproduces, then reproduce() creates and returns
-        the instance of the offspring SimpleVirus (which has the same
-        maxBirthProb and clearProb values as its parent).         
-
-        popDensity: the population density (a float), defined as the current
-        virus population divided by the maximum population.         
-        
-        returns: a new instance of the SimpleVirus class representing the
-        offspring of this virus particle. The child should have the same
-        maxBirthProb and clearProb values as this virus. Raises a
-        NoChildException if this virus particle does not reproduce.               
-        """
-        # TODO
-        if random.random() > self.maxBirthProb * (1 - popDensity):
-            raise NoChildException
-        return SimpleVirus(self.maxBirthProb,self.clearProb)
-        
-class SimplePatient(object):
-    """
-    Representation of a simplified patient. The patient does not take any drugs
-    and his/her virus populations have no drug resistance.
-    """
-    
-    def __init__(self, viruses, maxPop):
-        """
-        Initialization function, saves the viruses and maxPop parameters as
-        attributes.
-
-        viruses: the list representing the virus population (a list of
-        SimpleVirus instances)
-        
-        maxPop: the  maximum virus population for this patient (an integer)
-        """
-        # TODO
-        if type(viruses) != list and type(maxPop) != int: raise TypeError("Wrong input types")
-        self.viruses = viruses
-        self.maxPop = maxPop
-    #accessor
-    def getTotalPop(self):
-        """
-        Gets the current total virus population. 
-
-        returns: The total virus population (an integer)
-        """
-        # TODO        
-        return len(self.viruses)
-    
-    def update(self):
-        """
-        Update the state of the virus population in this patient for a single
-        time step. update() should execute the following steps in this order:
-
-        - Determine whether each virus particle survives and updates the list
-          of virus particles accordingly.
-
-        - The current population density is calculated. This population density
-          value is used until the next call to update() 
-
-        - Determine whether each virus particle should reproduce and add
-          offspring virus particles to the list of viruses in this patient.                    
-
-        returns: the total virus population at the end of the update (an
-        integer)
-        """
-        # TODO    
-        self.viruses = [virus for virus in self.viruses if not virus.doesClear()]
-        popDensity = self.getTotalPop()/float(self.maxPop)
-        for virus in self.viruses[:]:
-            try: self.viruses.append(virus.reproduce(popDensity))
-            except NoChildException: continue
-        return self.getTotalPop()
-    
-class ResistantVirus(SimpleVirus):
-    """
-    Representation of a virus which can have drug resistance.
-    """    
-    
-    def __init__(self, maxBirthProb, clearProb, resistances, mutProb):
-        """
-        Initialize a ResistantVirus instance, saves all parameters as attributes
-        of the instance.
-        
-        maxBirthProb: Maximum reproduction probability (a float between 0-1)        
-        
-        clearProb: Maximum clearance probability (a float between 0-1).
-        
-        resistances: A dictionary of drug names (strings) mapping to the state
-        of this virus particle's resistance (either True or False) to each drug.
-        e.g. {'guttagonol':False, 'grimpex',False}, means that this virus
-        particle is resistant to neither guttagonol nor grimpex.
-
-        mutProb: Mutation probability for this virus particle (a float). This is
-        the probability of the offspring acquiring or losing resistance to a drug.        
-        """
-        # TODO
-        if type(resistances) != dict: 
-            raise TypeError("ResistantVirus.__init__(): expected dict for type(resistances)")
-        if not 0 < mutProb <= 1:
-            raise ValueError("ResistantVirus.__init__(): expected a float between 0-1")
-        SimpleVirus.__init__(self,maxBirthProb,clearProb)
-        self.resistances = resistances
-        self.mutProb = mutProb
-        
-    def getResistance(self, drug):
-        """
-        Get the state of this virus particle's resistance to a drug. This method
-        is called by getResistPop() in Patient to determine how many virus
-        particles have resistance to a drug.        
-
-        drug: the drug (a string).
-
-        returns: True if this virus instance is resistant to the drug, False
-        otherwise.
-        """
-        # TODO    
-        try:
-            return self.resistances[drug]
-        except KeyError:
-            return False
-            
-    def reproduce(self, popDensity, activeDrugs):
-        """
-        Stochastically determines whether this virus particle reproduces at a
-        time step. Called by the update() method in the Patient class.
-
-        If the virus particle is not resistant to any drug in activeDrugs,
-        then it does not reproduce. Otherwise, the virus particle reproduces
-        with probability:       
-        
-        self.maxBirthProb * (1 - popDensity).                       
-        
-        If this virus particle reproduces, then reproduce() creates and returns
-        the instance of the offspring ResistantVirus (which has the same
-        maxBirthProb and clearProb values as its parent). 
-
-        For each drug resistance trait of the virus (i.e. each key of
-        self.resistances), the offspring has probability 1-mutProb of
-        inheriting that resistance trait from the parent, and probability
-        mutProb of switching that resistance trait in the offspring.        
-
-        For example, if a virus particle is resistant to guttagonol but not
-        grimpex, and `self.mutProb` is 0.1, then there is a 10% chance that
-        that the offspring will lose resistance to guttagonol and a 90% 
-        chance that the offspring will be resistant to guttagonol.
-        There is also a 10% chance that the offspring will gain resistance to
-        grimpex and a 90% chance that the offspring will not be resistant to
-        grimpex.
-
-        popDensity: the population density (a float), defined as the current
-        virus population divided by the maximum population        
-
-        activeDrugs: a list of the drug names acting on this virus particle
-        (a list of strings). 
-        
-        returns: a new instance of the ResistantVirus class representing the
-        offspring of this virus particle. The child should have the same
-        maxBirthProb and clearProb values as this virus. Raises a
-        NoChildException if this virus particle does not reproduce.         
-        """
-        # TODO    
-        if type(activeDrugs) != list: 
-            raise TypeError("reproduce(): expected list for type(activeDrugs)")
-        #if there is no drug, the virus is completely resistant
-        #if there is a drug(s), check if its resistant to all drugs, due to cocktails
-        resistant = bool(len(activeDrugs) == 0) or not bool([drug for drug in activeDrugs if self.resistances[drug] == False])
-        if resistant and random.random() <= self.maxBirthProb * (1 - popDensity):
-            child_resistances = self.resistances.copy()
-            for drug,resistance in self.resistances.iteritems():
-                if random.random() < self.mutProb:
-                    child_resistances[drug] = not resistance
-            return ResistantVirus(self.maxBirthProb,self.clearProb,child_resistances,self.mutProb)    
-        else: raise NoChildException
-        
-    
-class Patient(SimplePatient):
-    """Representation of a patient. The patient is able to take drugs and his/her
-    virus population can acquire resistance to the drugs he/she takes. """
-    
-    def __init__(self, viruses, maxPop):
-        """Initialization function, saves the viruses and maxPop parameters as
-        attributes. Also initializes the list of drugs being administered
-        (which should initially include no drugs).  
-        
-        viruses: the list representing the virus population (a list of
-        SimpleVirus instances)
-        
-        maxPop: the maximum virus population for this patient (an integer)
-        """
-        # TODO
-        SimplePatient.__init__(self,viruses,maxPop)
-        self.drugs_given = []
-        
-    def addPrescription(self, newDrug):
-        """
-        Administer a drug to this patient. After a prescription is added, the 
-        drug acts on the virus population for all subsequent time steps. If the
-        newDrug is already prescribed to this patient, the method has no effect.
-
-        newDrug: The name of the drug to administer to the patient (a string).
-
-        postcondition: list of drugs being administered to a patient is updated
-        """
-        # TODO
-        if type(newDrug) != str:
-            raise TypeError("addPrescription():expected string for type(newDrug)")
-        if newDrug not in self.drugs_given:
-            self.drugs_given.append(newDrug)
-    #accessors
-    def getPrescriptions(self):
-        """
-        Returns the drugs that are being administered to this patient.
-
-        returns: The list of drug names (strings) being administered to this
-        patient.
-        """
-        # TODO
-        return self.drugs_given
-    
-    def getResistPop(self, drugResist):
-        """
-        Get the population of virus particles resistant to the drugs listed in 
-        drugResist.        
-
-        drugResist: Which drug resistances to include in the population (a list
-        of strings - e.g. ['guttagonol'] or ['guttagonol', 'grimpex'])
-
-        returns: the population of viruses (an integer) with resistances to all
-        drugs in the drugResist list.
-        """
-        # TODO
-        if type(drugResist) != list:
-            raise TypeError("getResistPop():expected list for type(drugResist)")
-        i,j,resistant_viruses = 0,0,0
-        while i < len(self.viruses) and j < len(drugResist):
-            if not self.viruses[i].getResistance(drugResist[j]):
-                i += 1
-            else:
-                j += 1
-                if j >= len(drugResist):
-                    resistant_viruses += 1
-                    i += 1
-                    j = 0
-        return resistant_viruses
-    
-    def update(self):
-        """
-        Update the state of the virus population in this patient for a single
-        time step. update() should execute these actions in order:
-
-        - Determine whether each virus particle survives and update the list of 
-          virus particles accordingly
-          
-        - The current population density is calculated. This population density
-          value is used until the next call to update().
-
-        - Determine whether each virus particle should reproduce and add
-          offspring virus particles to the list of viruses in this patient. 
-          The listof drugs being administered should be accounted for in the
-          determination of whether each virus particle reproduces. 
-
-        returns: the total virus population at the end of the update (an
-        integer)
-        """
-        # TODO
-        self.viruses = [virus for virus in self.viruses if not virus.doesClear()]
-        popDensity = self.getTotalPop()/float(self.maxPop)
-        for virus in self.viruses[:]:
-            try:
-                self.viruses.append(virus.reproduce(popDensity, self.getPrescriptions()))
-            except NoChildException: continue
-        return self.getTotalPop()
-    
 #
 # PROBLEM 5
 #
-def createPatient():
+def createPatient(rng = random, skipSampling = False):
     maxPop = 1000
     maxBirthProb,clearProb,mutProb = 0.1,0.05,0.005
     resistances = {'guttagonol':False,'grimpex':False}
     viruses = [ResistantVirus(maxBirthProb,clearProb,resistances,mutProb)]*100
-    return Patient(viruses, maxPop)    
-
-def trialForNTimeSteps(n):
+    return Patient(viruses, maxPop, rng, skipSampling)
+
+def createSchedule(n):
+    """Returns the schedule of trialForNTimeSteps: guttagonol from step 150
+    on and grimpex from step 150 + n on"""
+    return Schedule({'guttagonol':150,'grimpex':150 + n})
+
+def trialPatientForNTimeSteps(n, rng = random):
+    """Simulates one patient of trialForNTimeSteps drawing from rng, returning
+    its final population"""
+    PatientZero = createPatient(rng)
+    PatientZero.setSchedule(createSchedule(n))
+    stop = 150 + n + 150
+    for i in xrange(1,stop):
+        #an extinct patient stays extinct, no need to simulate the rest
+        if PatientZero.update() == 0: break
+    return PatientZero.getTotalPop()
+
+def trialForNTimeSteps(n, workers = 1, seed = None, cache = None):
     """Takes n = number of time steps and simulates
-    the virus population for 30 patients, returning the all populations"""
-    pool_pop = []
-    for i in xrange(30):
-        PatientZero = createPatient()
-        population_after_time = [PatientZero.getTotalPop()]
-        
-        stop = 150 + n + 150
-        for i in xrange(1,stop):
-            if i >= 150: PatientZero.addPrescription('guttagonol')
-            if i >= 150 + n: PatientZero.addPrescription('grimpex')
-            population_after_time.append(PatientZero.update())
-        pool_pop.append(PatientZero.getTotalPop())
-    return pool_pop
+    the virus population for 30 patients, returning the all populations.
+    The patients are spread over workers processes, each patient drawing
+    from its own stream of seed. If a seed and a TrialCache are given, the
+    result is read from the cache when the same trial was run before"""
+    if seed is None: seed = random.randrange(2**32)
+    elif cache is not None:
+        key = cache.getKey('trialForNTimeSteps', n, describePatient(createPatient()),
+                           sorted(createSchedule(n).getChanges().items()), 30, seed)
+        return cache.fetch(key, trialForNTimeSteps, n, workers, seed)
+    streams = [Stream(streamSeed(seed, n, i)) for i in xrange(30)]
+    return runTrials(trialPatientForNTimeSteps, [(n, rng) for rng in streams], workers)
+
+def trialPatientForDelays(delays, seed, i):
+    """Simulates patient i of trialForDelays under every delay in delays.
+    The steps before grimpex are simulated once and the patient is cloned
+    into each delay as grimpex is introduced, returning the final populations
+    in the order of delays"""
+    PatientZero = createPatient(Stream(streamSeed(seed, -1, i)))
+    PatientZero.setSchedule(Schedule({'guttagonol':150}))
+    final_pop = {}
+    step = 1
+    for n in sorted(delays):
+        while step < 150 + n and PatientZero.getTotalPop() > 0:
+            PatientZero.update()
+            step += 1
+        treated = PatientZero.clone(Stream(streamSeed(seed, n, i)))
+        treated.setSchedule(createSchedule(n))
+        for j in xrange(step,300 + n):
+            if treated.update() == 0: break
+        final_pop[n] = treated.getTotalPop()
+    return [final_pop[n] for n in delays]
+
+def trialForDelays(delays, workers = 1, seed = None):
+    """Runs trialForNTimeSteps for every n in delays with the same 30
+    patients, sharing their steps before grimpex, returning the list of final
+    populations of each delay"""
+    if seed is None: seed = random.randrange(2**32)
+    trials = runTrials(trialPatientForDelays, [(delays, seed, i) for i in xrange(30)], workers)
+    return [list(pool_pop) for pool_pop in zip(*trials)]
+
+def cohortTrialForNTimeSteps(n, numPatients = 30, seed = None):
+    """Same trial as trialForNTimeSteps, but advances all the patients
+    together as one genotype-count cohort, returning the final populations"""
+    PatientZero = createPatient()
+    rng = Stream(None if seed is None else streamSeed(seed, n))
+    cohort = Cohort(PatientZero.viruses, PatientZero.maxPop, numPatients, rng)
+    cohort.setSchedule(createSchedule(n))
+    stop = 150 + n + 150
+    for i in xrange(1,stop):
+        if not cohort.update().any(): break
+    return list(cohort.getTotalPop())
 
 #
 # PROBLEM 6
@@ -371,11 +111,15 @@ def problem6():
     150, 75, 0 timesteps between adding drugs (followed by an additional 150
     timesteps of simulation)."""
     # TODO
+    pyplot = getPyplot()
+    workers = multiprocessing.cpu_count()
+    #with a fixed seed, reruns that only change the plots are read from the cache
+    cache,seed = TrialCache(),0
     start = time.time()
-#    hist1 = numpy.array(trialForNTimeSteps(0))
-#    hist2 = numpy.array(trialForNTimeSteps(75))
-    hist3 = numpy.array(trialForNTimeSteps(150))
-#    hist4 = numpy.array(trialForNTimeSteps(300))
+#    hist1 = numpy.array(trialForNTimeSteps(0, workers, seed, cache))
+#    hist2 = numpy.array(trialForNTimeSteps(75, workers, seed, cache))
+    hist3 = numpy.array(trialForNTimeSteps(150, workers, seed, cache))
+#    hist4 = numpy.array(trialForNTimeSteps(300, workers, seed, cache))
     end = time.time()
     print (int(end - start))/60,"minutes"
 
@@ -387,7 +131,8 @@ def problem6():
     pyplot.ylabel("Number of Patients")
     pyplot.show()    
 
-problem6()  
+if __name__ == '__main__':
+    problem6()  
 
 
 
@@ -403,17 +148,16 @@ def problem4_6():
     vs. time are plotted
     """
     # TODO
+    pyplot = getPyplot()
     PatientZero = createPatient()
+    #induce drug after 150 time steps
+    PatientZero.setSchedule(Schedule({'guttagonol':150,'grimpex':150}))
+#    #wait for another 75 timesteps then induce grimpex
+#    PatientZero.setSchedule(Schedule({'guttagonol':150,'grimpex':225}))
     population_after_time = [PatientZero.getTotalPop()]
     resistant_pop_after_time = [PatientZero.getResistPop(PatientZero.getPrescriptions())]
     #let the virus particles do their thing for 150 time steps
     for i in xrange(1,300):
-        #induce drug after 150 time steps
-        if i >= 150: 
-            PatientZero.addPrescription('guttagonol')
-            PatientZero.addPrescription('grimpex')
-#        #wait for another 75 timesteps then induce grimpex
-#        if i >= 225: PatientZero.addPrescription('grimpex')
         population_after_time.append(PatientZero.update())
         resistant_pop_after_time.append(PatientZero.getResistPop(PatientZero.getPrescriptions()))
         
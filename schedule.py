@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+class Schedule(object):
+    """
+    A treatment schedule: which drugs act on the virus population at each
+    time step. Time steps are numbered from 1, the first update() of a
+    patient. A patient following a schedule only changes its prescriptions
+    at the steps where the set of active drugs changes.
+    """
+
+    def __init__(self, starts = None):
+        """
+        Initialization function.
+
+        starts: the drugs given until the end of the simulation (a dictionary
+        mapping drug names to the first time step they act on, e.g.
+        {'guttagonol':150, 'grimpex':225}), or None for an empty schedule
+        """
+        self.doses = []
+        if starts is not None:
+            for drug in sorted(starts):
+                self.addDrug(drug, starts[drug])
+
+    def addDrug(self, drug, start, stop = None):
+        """
+        Gives a drug over a range of time steps.
+
+        drug: the name of the drug (a string)
+
+        start: the first time step the drug acts on (an integer)
+
+        stop: the first time step the drug no longer acts on (an integer), or
+        None to keep giving it
+        """
+        if type(drug) != str:
+            raise TypeError("addDrug():expected string for type(drug)")
+        if stop is not None and stop <= start:
+            raise ValueError("addDrug():stop must be after start")
+        self.doses.append((drug, start, stop))
+
+    def getDrugs(self, step):
+        """
+        Gets the drugs acting on a time step.
+
+        step: the time step (an integer)
+
+        returns: the drugs acting on the step, sorted by name (a list of
+        strings)
+        """
+        return sorted(set(drug for drug, start, stop in self.doses
+                          if start <= step and (stop is None or step < stop)))
+
+    def getChanges(self):
+        """
+        Compiles the schedule into its change points.
+
+        returns: a dictionary mapping every time step where the set of active
+        drugs changes to the drugs acting from that step on (a list of strings)
+        """
+        changes = {}
+        drugs = []
+        points = set(max(start, 1) for drug, start, stop in self.doses)
+        points.update(stop for drug, start, stop in self.doses if stop is not None and stop > 1)
+        for step in sorted(points):
+            if self.getDrugs(step) != drugs:
+                drugs = self.getDrugs(step)
+                changes[step] = drugs
+        return changes
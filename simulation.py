@@ -0,0 +1,776 @@
+# -*- coding: utf-8 -*-
+
+import random
+import copy
+import itertools
+import numpy
+from drugs import registry
+from streams import geometricEvents, uniformDraws
+
+class NoChildException(Exception):
+    """
+    NoChildException is raised by the reproduce() method in the SimpleVirus
+    and ResistantVirus classes to indicate that a virus particle does not
+    reproduce. You can use NoChildException as is, you do not need to
+    modify/add any code.
+    """    
+
+class Strain(object):
+    """
+    The constants shared by every virus particle of a strain. Particles keep a
+    reference to their strain instead of their own copies of these, and
+    get() hands out one instance per set of constants, so a population of a
+    few strains holds a few Strain instances however many particles it has.
+    """
+    __slots__ = ('maxBirthProb', 'clearProb', 'mutProb', 'traits')
+    #the instances handed out by get(), by their constants
+    strains = {}
+
+    def __init__(self, maxBirthProb, clearProb, mutProb = 0., traits = 0):
+        """
+        Initialization function. Use get() rather than calling this directly.
+
+        maxBirthProb: Maximum reproduction probability (a float between 0-1)
+
+        clearProb: Maximum clearance probability (a float between 0-1)
+
+        mutProb: Mutation probability of the offspring's traits (a float)
+
+        traits: the registry mask of the drugs named in the particles'
+        resistances (an integer)
+        """
+        self.maxBirthProb = maxBirthProb
+        self.clearProb = clearProb
+        self.mutProb = mutProb
+        self.traits = traits
+
+    @classmethod
+    def get(cls, maxBirthProb, clearProb, mutProb = 0., traits = 0):
+        """
+        Gets the strain of the given constants, creating it the first time.
+
+        returns: the shared instance (a Strain)
+        """
+        key = maxBirthProb, clearProb, mutProb, traits
+        try:
+            return cls.strains[key]
+        except KeyError:
+            strain = cls.strains[key] = cls(*key)
+            return strain
+
+    def getKey(self):
+        """
+        Returns the constants of the strain (a tuple).
+        """
+        return self.maxBirthProb, self.clearProb, self.mutProb, self.traits
+
+    def __eq__(self, other):
+        return isinstance(other, Strain) and self.getKey() == other.getKey()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.getKey())
+
+    def __reduce__(self):
+        return Strain, self.getKey()
+
+class SimpleVirus(object):
+    """
+    Representation of a simple virus (does not model drug effects/resistance).
+    """
+    __slots__ = ('strain',)
+    
+    def __init__(self, maxBirthProb, clearProb):
+        """
+        Initialize a SimpleVirus instance, saves all parameters as attributes
+        of the instance.        
+        
+        maxBirthProb: Maximum reproduction probability (a float between 0-1)        
+        
+        clearProb: Maximum clearance probability (a float between 0-1).
+        """
+        # TODO
+        if not 0 < maxBirthProb < 1 and 0 < clearProb < 1:
+            raise ValueError("value should be between 0 and 1")
+        self.strain = Strain.get(float(maxBirthProb), float(clearProb))
+
+    @property
+    def maxBirthProb(self):
+        """
+        Maximum reproduction probability (a float between 0-1).
+        """
+        return self.strain.maxBirthProb
+
+    @property
+    def clearProb(self):
+        """
+        Maximum clearance probability (a float between 0-1).
+        """
+        return self.strain.clearProb
+
+    def __getstate__(self):
+        #instances have no __dict__, pickle and copy go through the slots
+        return dict((name, getattr(self, name)) for cls in type(self).__mro__
+                    for name in getattr(cls, '__slots__', ()))
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+    
+    def doesClear(self, rng = random):
+        """
+        Stochastically determines whether this virus is cleared from the
+        patient's body at a time step. 
+
+        rng: the random number generator to draw from (the random module, or
+        the patient's Stream)
+
+        returns: Using a random number generator (rng.random()), this method
+        returns True with probability self.clearProb and otherwise returns
+        False.
+        """
+        # TODO
+        return rng.random() < self.clearProb
+    
+    def reproduce(self, popDensity, rng = random):
+        """
+        Stochastically determines whether this virus particle reproduces at a
+        time step. Called by the update() method in the SimplePatient and
+        Patient classes. The virus particle reproduces with probability
+        self.maxBirthProb * (1 - popDensity).
+        
+        If this virus particle reproduces, then reproduce() creates and returns
+        the instance of the offspring SimpleVirus (which has the same
+        maxBirthProb and clearProb values as its parent).         
+
+        popDensity: the population density (a float), defined as the current
+        virus population divided by the maximum population.         
+
+        rng: the random number generator to draw from (the random module, or
+        the patient's Stream)
+        
+        returns: a new instance of the SimpleVirus class representing the
+        offspring of this virus particle. The child should have the same
+        maxBirthProb and clearProb values as this virus. Raises a
+        NoChildException if this virus particle does not reproduce.               
+        """
+        # TODO
+        if rng.random() > self.maxBirthProb * (1 - popDensity):
+            raise NoChildException
+        return SimpleVirus(self.maxBirthProb,self.clearProb)
+
+    @classmethod
+    def reproduceAll(cls, viruses, popDensity, rng = random, children = None, count = None):
+        """
+        Determines which virus particles reproduce at a time step, as calling
+        reproduce() on each of them in turn, but without raising a
+        NoChildException for every particle that does not reproduce. With a
+        Stream, the uniform numbers of the whole pass are drawn in one block.
+
+        viruses: the virus particles (a list of SimpleVirus instances)
+
+        popDensity: the population density (a float), defined as the current
+        virus population divided by the maximum population.
+
+        rng: the random number generator to draw from (the random module, or
+        the patient's Stream)
+
+        children: the list the offspring are appended to, or None for a new
+        list
+
+        count: the number of particles at the front of viruses that may
+        reproduce (an integer), or None for all of them; the offspring can
+        then be appended to viruses itself, behind the first count particles
+
+        returns: children, with the offspring appended in the order of their
+        parents (a list of SimpleVirus instances)
+        """
+        if children is None: children = []
+        if count is None: count = len(viruses)
+        for virus, draw in itertools.izip(itertools.islice(viruses, count), uniformDraws(rng, count)):
+            if draw <= virus.strain.maxBirthProb * (1 - popDensity):
+                child = cls.__new__(cls)
+                child.strain = virus.strain
+                children.append(child)
+        return children
+        
+class SimplePatient(object):
+    """
+    Representation of a simplified patient. The patient does not take any drugs
+    and his/her virus populations have no drug resistance.
+    """
+    
+    def __init__(self, viruses, maxPop, rng = random):
+        """
+        Initialization function, saves the viruses and maxPop parameters as
+        attributes.
+
+        viruses: the list representing the virus population (a list of
+        SimpleVirus instances)
+        
+        maxPop: the  maximum virus population for this patient (an integer)
+
+        rng: the random number generator this patient's viruses draw from (the
+        random module, or a Stream owned by this patient)
+        """
+        # TODO
+        if type(viruses) != list and type(maxPop) != int: raise TypeError("Wrong input types")
+        #update() changes the list in place, so the patient keeps its own
+        self.viruses = list(viruses)
+        self.maxPop = maxPop
+        self.rng = rng
+    #accessor
+    def getTotalPop(self):
+        """
+        Gets the current total virus population. 
+
+        returns: The total virus population (an integer)
+        """
+        # TODO        
+        return len(self.viruses)
+
+    def clone(self, rng = None):
+        """
+        Snapshots this patient mid-run. The copy evolves independently of this
+        patient, so a shared stretch of a simulation can be run once and then
+        branched into several treatment schedules.
+
+        rng: the random number generator the copy draws from (the random
+        module or a Stream), or None to continue from a copy of this patient's
+        Stream (the random module itself is shared)
+
+        returns: the copy of this patient
+        """
+        twin = copy.copy(self)
+        #virus particles are never changed once created, so they are shared
+        twin.viruses = self.viruses[:]
+        if rng is None and self.rng is not random:
+            rng = copy.deepcopy(self.rng)
+        twin.rng = self.rng if rng is None else rng
+        return twin
+    
+    def update(self):
+        """
+        Update the state of the virus population in this patient for a single
+        time step. update() should execute the following steps in this order:
+
+        - Determine whether each virus particle survives and updates the list
+          of virus particles accordingly.
+
+        - The current population density is calculated. This population density
+          value is used until the next call to update() 
+
+        - Determine whether each virus particle should reproduce and add
+          offspring virus particles to the list of viruses in this patient.                    
+
+        returns: the total virus population at the end of the update (an
+        integer)
+        """
+        # TODO    
+        #an extinct population stays extinct
+        if not self.viruses: return 0
+        survivors = self.compact()
+        popDensity = survivors/float(self.maxPop)
+        #the children go behind the survivors, in the same list
+        SimpleVirus.reproduceAll(self.viruses, popDensity, self.rng, self.viruses, survivors)
+        return self.getTotalPop()
+
+    def compact(self):
+        """
+        Removes the virus particles cleared at this time step, moving the
+        survivors to the front of the list in place, in their order, so the
+        list's storage is reused from step to step rather than rebuilt. Each
+        particle is cleared as by doesClear(), with the uniform numbers drawn
+        in one block from a Stream.
+
+        returns: the number of survivors (an integer)
+        """
+        viruses = self.viruses
+        survivors = 0
+        for virus, draw in itertools.izip(viruses, uniformDraws(self.rng, len(viruses))):
+            if draw < virus.strain.clearProb:
+                self.removeVirus(virus)
+            else:
+                viruses[survivors] = virus
+                survivors += 1
+        del viruses[survivors:]
+        return survivors
+
+    def removeVirus(self, virus):
+        """
+        Called by compact() for every cleared virus particle, for subclasses
+        keeping statistics of the population.
+
+        virus: the cleared particle (a SimpleVirus)
+        """
+        pass
+    
+class ResistantVirus(SimpleVirus):
+    """
+    Representation of a virus which can have drug resistance.
+    """    
+    __slots__ = ('genotype',)
+    
+    def __init__(self, maxBirthProb, clearProb, resistances, mutProb):
+        """
+        Initialize a ResistantVirus instance, saves all parameters as attributes
+        of the instance.
+        
+        maxBirthProb: Maximum reproduction probability (a float between 0-1)        
+        
+        clearProb: Maximum clearance probability (a float between 0-1).
+        
+        resistances: A dictionary of drug names (strings) mapping to the state
+        of this virus particle's resistance (either True or False) to each drug.
+        e.g. {'guttagonol':False, 'grimpex',False}, means that this virus
+        particle is resistant to neither guttagonol nor grimpex.
+
+        mutProb: Mutation probability for this virus particle (a float). This is
+        the probability of the offspring acquiring or losing resistance to a drug.        
+        """
+        # TODO
+        if type(resistances) != dict: 
+            raise TypeError("ResistantVirus.__init__(): expected dict for type(resistances)")
+        if not 0 < mutProb <= 1:
+            raise ValueError("ResistantVirus.__init__(): expected a float between 0-1")
+        SimpleVirus.__init__(self,maxBirthProb,clearProb)
+        #the drugs named in resistances and the ones resisted, as registry masks
+        self.strain = Strain.get(self.maxBirthProb, self.clearProb, mutProb, registry.getMask(resistances))
+        self.genotype = registry.encode(resistances)
+
+    @property
+    def mutProb(self):
+        """
+        Mutation probability for this virus particle (a float).
+        """
+        return self.strain.mutProb
+
+    @property
+    def traits(self):
+        """
+        The registry mask of the drugs named in this virus particle's
+        resistances (an integer).
+        """
+        return self.strain.traits
+
+    @classmethod
+    def fromStrain(cls, strain, genotype):
+        """
+        Creates a ResistantVirus of an existing strain, without building and
+        validating a resistances dictionary. Used for the offspring of an
+        already validated parent.
+
+        strain: the strain of the particle (a Strain)
+
+        genotype: the mask of the drugs the particle is resistant to (an
+        integer)
+
+        returns: a new instance of the ResistantVirus class
+        """
+        virus = cls.__new__(cls)
+        virus.strain = strain
+        virus.genotype = genotype
+        return virus
+
+    @property
+    def resistances(self):
+        """
+        A dictionary of drug names (strings) mapping to the state of this virus
+        particle's resistance (either True or False) to each drug, rebuilt from
+        the genotype.
+        """
+        return registry.decode(self.genotype, self.traits)
+        
+    def getResistance(self, drug):
+        """
+        Get the state of this virus particle's resistance to a drug. This method
+        is called by getResistPop() in Patient to determine how many virus
+        particles have resistance to a drug.        
+
+        drug: the drug (a string).
+
+        returns: True if this virus instance is resistant to the drug, False
+        otherwise.
+        """
+        # TODO    
+        return bool(self.genotype & registry.bits.get(drug, 0))
+            
+    def reproduce(self, popDensity, activeDrugs, rng = random):
+        """
+        Stochastically determines whether this virus particle reproduces at a
+        time step. Called by the update() method in the Patient class.
+
+        If the virus particle is not resistant to any drug in activeDrugs,
+        then it does not reproduce. Otherwise, the virus particle reproduces
+        with probability:       
+        
+        self.maxBirthProb * (1 - popDensity).                       
+        
+        If this virus particle reproduces, then reproduce() creates and returns
+        the instance of the offspring ResistantVirus (which has the same
+        maxBirthProb and clearProb values as its parent). 
+
+        For each drug resistance trait of the virus (i.e. each key of
+        self.resistances), the offspring has probability 1-mutProb of
+        inheriting that resistance trait from the parent, and probability
+        mutProb of switching that resistance trait in the offspring.        
+
+        For example, if a virus particle is resistant to guttagonol but not
+        grimpex, and `self.mutProb` is 0.1, then there is a 10% chance that
+        that the offspring will lose resistance to guttagonol and a 90% 
+        chance that the offspring will be resistant to guttagonol.
+        There is also a 10% chance that the offspring will gain resistance to
+        grimpex and a 90% chance that the offspring will not be resistant to
+        grimpex.
+
+        popDensity: the population density (a float), defined as the current
+        virus population divided by the maximum population        
+
+        activeDrugs: a list of the drug names acting on this virus particle
+        (a list of strings), or their registry mask (an integer). 
+
+        rng: the random number generator to draw from (the random module, or
+        the patient's Stream)
+        
+        returns: a new instance of the ResistantVirus class representing the
+        offspring of this virus particle. The child should have the same
+        maxBirthProb and clearProb values as this virus. Raises a
+        NoChildException if this virus particle does not reproduce.         
+        """
+        # TODO    
+        children = self.reproduceAll([self], popDensity, activeDrugs, rng)
+        if not children: raise NoChildException
+        return children[0]
+
+    @classmethod
+    def reproduceAll(cls, viruses, popDensity, activeDrugs, rng = random, children = None, count = None):
+        """
+        Determines which virus particles reproduce at a time step, as calling
+        reproduce() on each of them in turn, but without raising a
+        NoChildException for every particle that does not reproduce. The
+        births of the whole pass are drawn first, then the mutations of the
+        children, each in one block with a Stream.
+
+        viruses: the virus particles (a list of ResistantVirus instances)
+
+        popDensity: the population density (a float), defined as the current
+        virus population divided by the maximum population
+
+        activeDrugs: a list of the drug names acting on the virus particles
+        (a list of strings), or their registry mask (an integer).
+
+        rng: the random number generator to draw from (the random module, or
+        the patient's Stream)
+
+        children: the list the offspring are appended to, or None for a new
+        list
+
+        count: the number of particles at the front of viruses that may
+        reproduce (an integer), or None for all of them; the offspring can
+        then be appended to viruses itself, behind the first count particles
+
+        returns: children, with the offspring appended in the order of their
+        parents (a list of ResistantVirus instances)
+        """
+        if type(activeDrugs) == list:
+            activeDrugs = registry.getMask(activeDrugs)
+        elif type(activeDrugs) != int:
+            raise TypeError("reproduce(): expected list for type(activeDrugs)")
+        if children is None: children = []
+        if count is None: count = len(viruses)
+        #if there is no drug, the mask is empty and the virus is resistant
+        #if there is a drug(s), check if its resistant to all drugs, due to cocktails
+        parents = [virus for virus, draw in itertools.izip(itertools.islice(viruses, count), uniformDraws(rng, count))
+                   if (virus.genotype & activeDrugs) == activeDrugs
+                   and draw <= virus.strain.maxBirthProb * (1 - popDensity)]
+        traits = [registry.getBits(virus.strain.traits) for virus in parents]
+        flips = iter(uniformDraws(rng, sum(len(bits) for bits in traits)))
+        for virus, bits in itertools.izip(parents, traits):
+            strain = virus.strain
+            genotype = virus.genotype
+            for bit in bits:
+                if next(flips) < strain.mutProb:
+                    genotype ^= bit
+            children.append(cls.fromStrain(strain,genotype))
+        return children
+        
+    
+class Patient(SimplePatient):
+    """Representation of a patient. The patient is able to take drugs and his/her
+    virus population can acquire resistance to the drugs he/she takes. """
+    
+    def __init__(self, viruses, maxPop, rng = random, skipSampling = False):
+        """Initialization function, saves the viruses and maxPop parameters as
+        attributes. Also initializes the list of drugs being administered
+        (which should initially include no drugs).  
+        
+        viruses: the list representing the virus population (a list of
+        SimpleVirus instances)
+        
+        maxPop: the maximum virus population for this patient (an integer)
+
+        rng: the random number generator this patient's viruses draw from (the
+        random module, or a Stream owned by this patient)
+
+        skipSampling: whether update() draws only the particles that clear,
+        reproduce or mutate, see skipUpdate() (a boolean); the viruses must
+        then share maxBirthProb, clearProb, mutProb and the drugs named in
+        their resistances
+        """
+        # TODO
+        if skipSampling and len(set(virus.strain for virus in viruses)) > 1:
+            raise ValueError("Patient.__init__(): skip sampling needs viruses of one strain")
+        SimplePatient.__init__(self,viruses,maxPop,rng)
+        self.skip_sampling = skipSampling
+        self.drugs_given = []
+        self.drugs_mask = 0
+        #time steps simulated, and the prescription changes of the schedule
+        self.step = 0
+        self.schedule_changes = {}
+        #live population of each genotype, kept up to date by update()
+        self.genotype_counts = {}
+        #the drugs named in the resistances of any particle, as a registry mask
+        self.traits = 0
+        for virus in self.viruses:
+            self.genotype_counts[virus.genotype] = self.genotype_counts.get(virus.genotype, 0) + 1
+            self.traits |= virus.traits
+        #genotype counts after each step, if recorded, see startHistory()
+        self.history = None
+
+    def clone(self, rng = None):
+        """
+        Snapshots this patient mid-run, including its prescriptions, see
+        SimplePatient.clone().
+
+        rng: the random number generator the copy draws from, or None to
+        continue from a copy of this patient's generator
+
+        returns: the copy of this patient
+        """
+        twin = SimplePatient.clone(self, rng)
+        twin.drugs_given = self.drugs_given[:]
+        twin.genotype_counts = self.genotype_counts.copy()
+        if self.history is not None: twin.history = self.history[:]
+        return twin
+        
+    def addPrescription(self, newDrug):
+        """
+        Administer a drug to this patient. After a prescription is added, the 
+        drug acts on the virus population for all subsequent time steps. If the
+        newDrug is already prescribed to this patient, the method has no effect.
+
+        newDrug: The name of the drug to administer to the patient (a string).
+
+        postcondition: list of drugs being administered to a patient is updated
+        """
+        # TODO
+        if type(newDrug) != str:
+            raise TypeError("addPrescription():expected string for type(newDrug)")
+        if newDrug not in self.drugs_given:
+            self.drugs_given.append(newDrug)
+            self.drugs_mask |= registry.getBit(newDrug)
+
+    def setPrescriptions(self, drugs):
+        """
+        Replaces the drugs administered to this patient.
+
+        drugs: the names of the drugs to administer (a list of strings)
+
+        postcondition: list of drugs being administered to a patient is updated
+        """
+        self.drugs_given = list(drugs)
+        self.drugs_mask = registry.getMask(drugs)
+
+    def setSchedule(self, schedule):
+        """
+        Has this patient follow a treatment schedule: at each change point of
+        the schedule, update() replaces the prescriptions with the drugs the
+        schedule gives from that step on. Steps are counted from the first
+        update() of this patient.
+
+        schedule: the treatment schedule (a Schedule)
+        """
+        self.schedule_changes = schedule.getChanges()
+
+    def followSchedule(self):
+        """
+        Counts a time step, switching prescriptions if the schedule changes at
+        this step.
+        """
+        self.step += 1
+        if self.step in self.schedule_changes:
+            self.setPrescriptions(self.schedule_changes[self.step])
+    #accessors
+    def getPrescriptions(self):
+        """
+        Returns the drugs that are being administered to this patient.
+
+        returns: The list of drug names (strings) being administered to this
+        patient.
+        """
+        # TODO
+        return self.drugs_given
+    
+    def getResistPop(self, drugResist):
+        """
+        Get the population of virus particles resistant to the drugs listed in 
+        drugResist.        
+
+        drugResist: Which drug resistances to include in the population (a list
+        of strings - e.g. ['guttagonol'] or ['guttagonol', 'grimpex'])
+
+        returns: the population of viruses (an integer) with resistances to all
+        drugs in the drugResist list, read from the genotype counts kept by
+        update() rather than by scanning the population.
+        """
+        # TODO
+        if type(drugResist) != list:
+            raise TypeError("getResistPop():expected list for type(drugResist)")
+        mask = registry.findMask(drugResist)
+        #an empty drugResist list selects no virus particles, and no particle
+        #resists a drug that was never registered
+        if not drugResist or mask is None:
+            return 0
+        return sum(count for genotype,count in self.genotype_counts.iteritems() if genotype & mask == mask)
+
+    def startHistory(self):
+        """
+        Starts recording the genotype counts after every update(), from the
+        current state on, so that resistance queries can be answered after the
+        run with getHistoryPop() instead of at every step.
+        """
+        self.history = []
+        self.recordCounts()
+
+    def recordCounts(self):
+        """
+        Appends the current time step and genotype counts to the history.
+        """
+        self.history.append((self.step, self.genotype_counts.copy()))
+
+    def getHistory(self):
+        """
+        Gets the recorded history, see startHistory().
+
+        returns: the time steps recorded (a numpy array of integers), and the
+        count of each genotype at those steps (a steps x genotypes numpy array
+        whose columns are indexed by registry genotype, covering the drugs
+        named in the particles' resistances)
+        """
+        counts = numpy.zeros((len(self.history), 2 ** self.traits.bit_length()), dtype=numpy.int64)
+        for row,(step,genotype_counts) in enumerate(self.history):
+            for genotype,count in genotype_counts.iteritems():
+                counts[row, genotype] = count
+        return numpy.array([step for step,genotype_counts in self.history]),counts
+
+    def getHistoryPop(self, resistant = [], susceptible = []):
+        """
+        Gets the recorded population of virus particles resistant to every
+        drug in resistant and to none of the drugs in susceptible, e.g.
+        resistant = ['guttagonol'] and susceptible = ['grimpex'] for the
+        particles resistant to guttagonol only. The particles resistant to
+        either drug are the total minus getHistoryPop([], ['guttagonol',
+        'grimpex']).
+
+        resistant: the drugs resisted (a list of strings)
+
+        susceptible: the drugs not resisted (a list of strings)
+
+        returns: the population at every recorded time step (a numpy array of
+        integers)
+        """
+        steps,counts = self.getHistory()
+        genotypes = numpy.arange(counts.shape[1])
+        mask = registry.findMask(resistant)
+        #no particle resists a drug that was never registered
+        if mask is None:
+            return counts[:, 0]*0
+        excluded = registry.findMask([drug for drug in susceptible if drug in registry.bits])
+        return counts[:, (genotypes & mask == mask) & (genotypes & excluded == 0)].sum(axis=1)
+    
+    def update(self):
+        """
+        Update the state of the virus population in this patient for a single
+        time step. update() should execute these actions in order:
+
+        - Determine whether each virus particle survives and update the list of 
+          virus particles accordingly
+          
+        - The current population density is calculated. This population density
+          value is used until the next call to update().
+
+        - Determine whether each virus particle should reproduce and add
+          offspring virus particles to the list of viruses in this patient. 
+          The listof drugs being administered should be accounted for in the
+          determination of whether each virus particle reproduces. 
+
+        returns: the total virus population at the end of the update (an
+        integer)
+        """
+        # TODO
+        self.followSchedule()
+        #an extinct population stays extinct
+        if self.viruses:
+            if self.skip_sampling: self.skipUpdate()
+            else: self.particleUpdate()
+        if self.history is not None: self.recordCounts()
+        return self.getTotalPop()
+
+    def particleUpdate(self):
+        """
+        Performs update() drawing the clearance and reproduction of every
+        particle in turn.
+
+        returns: the total virus population at the end of the update (an
+        integer)
+        """
+        survivors = self.compact()
+        popDensity = survivors/float(self.maxPop)
+        #the children go behind the survivors, in the same list
+        ResistantVirus.reproduceAll(self.viruses, popDensity, self.drugs_mask, self.rng,
+                                    self.viruses, survivors)
+        for i in xrange(survivors, len(self.viruses)):
+            genotype = self.viruses[i].genotype
+            self.genotype_counts[genotype] = self.genotype_counts.get(genotype, 0) + 1
+        return self.getTotalPop()
+
+    def removeVirus(self, virus):
+        """
+        Keeps the genotype counts when compact() clears a virus particle.
+
+        virus: the cleared particle (a ResistantVirus)
+        """
+        self.genotype_counts[virus.genotype] -= 1
+
+    def skipUpdate(self):
+        """
+        Performs update() by skip sampling: the particles that clear, the
+        particles that reproduce and the traits that mutate are picked with
+        geometricEvents(), so only those are drawn and touched. Non-resistant
+        particles picked to reproduce are dropped, which leaves each particle
+        the same probability of every outcome as in update(). Cleared
+        particles are replaced by the last particle of the list, so the order
+        of the viruses is not kept.
+
+        returns: the total virus population at the end of the update (an
+        integer)
+        """
+        strain = self.viruses[0].strain
+        for i in reversed(geometricEvents(len(self.viruses), strain.clearProb, self.rng)):
+            self.genotype_counts[self.viruses[i].genotype] -= 1
+            self.viruses[i] = self.viruses[-1]
+            self.viruses.pop()
+        popDensity = self.getTotalPop()/float(self.maxPop)
+        birthProb = strain.maxBirthProb * (1 - popDensity)
+        genotypes = [self.viruses[i].genotype for i in geometricEvents(len(self.viruses), birthProb, self.rng)
+                     if self.viruses[i].genotype & self.drugs_mask == self.drugs_mask]
+        bits = registry.getBits(strain.traits)
+        #trait j of child k is trial k*len(bits) + j
+        for trial in geometricEvents(len(genotypes)*len(bits), strain.mutProb, self.rng):
+            genotypes[trial // len(bits)] ^= bits[trial % len(bits)]
+        for genotype in genotypes:
+            self.viruses.append(ResistantVirus.fromStrain(strain,genotype))
+            self.genotype_counts[genotype] = self.genotype_counts.get(genotype, 0) + 1
+        return self.getTotalPop()
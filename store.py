@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import json
+import numpy
+
+#the header is padded to a fixed size so the array starts at a known offset
+HEADER_SIZE = 4096
+MAGIC = 'virus trajectories'
+
+class TrajectoryStore(object):
+    """
+    Per-patient trajectories kept in a memory-mapped array file: a small JSON
+    header followed by a patients x series x steps array. Only the parts
+    that are read or written are loaded into memory, the file outlives the
+    process, and several processes may each open the file and write the
+    rows of different patients at the same time.
+    """
+
+    def __init__(self, path, header, mode):
+        """
+        Initialization function, maps the array of an existing file. Use
+        create() or load() rather than calling this directly.
+
+        path: the path of the file (a string)
+
+        header: the decoded header of the file (a dictionary)
+
+        mode: the numpy.memmap mode ('r', 'r+' or 'w+')
+        """
+        self.path = path
+        self.names = header['names']
+        self.metadata = header['metadata']
+        self.data = numpy.memmap(path, dtype=numpy.dtype(str(header['dtype'])), mode=mode,
+                                 offset=HEADER_SIZE, shape=tuple(header['shape']))
+
+    @classmethod
+    def create(cls, path, numPatients, names, steps, metadata = None, dtype = numpy.int32):
+        """
+        Creates a store file, overwriting any file at path.
+
+        path: the path of the file (a string)
+
+        numPatients: the number of patients (an integer)
+
+        names: the name of each series (a list of strings)
+
+        steps: the number of time steps of each series (an integer)
+
+        metadata: anything else worth keeping with the trajectories, e.g. the
+        delay and seed of the trial (a dictionary that json can encode)
+
+        dtype: the type of the values (a numpy type)
+
+        returns: the store, open for writing
+        """
+        header = {'magic':MAGIC, 'names':list(names), 'shape':[numPatients, len(names), steps],
+                  'dtype':numpy.dtype(dtype).str, 'metadata':metadata or {}}
+        encoded = json.dumps(header)
+        if len(encoded) > HEADER_SIZE:
+            raise ValueError("TrajectoryStore.create(): metadata too large for the header")
+        with open(path, 'wb') as f:
+            f.write(encoded.ljust(HEADER_SIZE))
+        return cls(path, header, 'r+')
+
+    @classmethod
+    def load(cls, path, mode = 'r'):
+        """
+        Opens an existing store file.
+
+        path: the path of the file (a string)
+
+        mode: 'r' to read, or 'r+' to also write patients' rows
+
+        returns: the store
+        """
+        with open(path, 'rb') as f:
+            header = json.loads(f.read(HEADER_SIZE))
+        if header.get('magic') != MAGIC:
+            raise ValueError("TrajectoryStore.load(): %s is not a trajectory store" % path)
+        return cls(path, header, mode)
+
+    def write(self, patient, series):
+        """
+        Writes one patient's trajectories.
+
+        patient: the index of the patient (an integer)
+
+        series: the patient's series (a list of lists of numbers, in the
+        order of names)
+        """
+        self.data[patient] = series
+
+    def getSeries(self, name):
+        """
+        Gets one series of every patient.
+
+        name: the name of the series (a string)
+
+        returns: the series (a patients x steps memory-mapped array)
+        """
+        return self.data[:, self.names.index(name)]
+
+    def flush(self):
+        """
+        Writes pending changes to the file.
+        """
+        self.data.flush()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import math
+import random
+import numpy
+
+def streamSeed(masterSeed, *indices):
+    """
+    Derives the seed of a random stream from a master seed and the indices
+    naming the stream, e.g. streamSeed(seed, condition, patient). The seed is
+    a hash of the whole tuple, so every stream is independent of the others
+    and of the order in which they are created.
+
+    masterSeed: the seed of the whole sweep (an integer)
+
+    indices: the integers naming the stream
+
+    returns: the seed of the stream (a 128-bit integer)
+    """
+    key = repr(tuple(int(i) for i in (masterSeed,) + indices))
+    return int(hashlib.sha256(key).hexdigest()[:32], 16)
+
+def geometricEvents(n, prob, rng = random):
+    """
+    Picks which of n independent trials succeed, each with probability prob,
+    by drawing the geometric gaps between successes. Only one random number
+    is drawn per success (plus one), instead of one per trial.
+
+    n: the number of trials (an integer)
+
+    prob: the probability of success of each trial (a float)
+
+    rng: the random number generator to draw from (the random module, or a
+    Stream)
+
+    returns: the indices of the successful trials, in increasing order (a
+    list of integers)
+    """
+    if prob <= 0:
+        return []
+    if prob >= 1:
+        return range(n)
+    logFail = math.log(1 - prob)
+    events = []
+    #1 - random() is in (0, 1], so the log is finite
+    i = int(math.log(1 - rng.random())/logFail)
+    while i < n:
+        events.append(i)
+        i += 1 + int(math.log(1 - rng.random())/logFail)
+    return events
+
+def uniformDraws(rng, n):
+    """
+    Draws the uniform numbers of one pass over n virus particles.
+
+    rng: the random number generator to draw from (the random module, or a
+    Stream)
+
+    returns: n floats in [0, 1) drawn in one block from a Stream (a list), or
+    an iterator calling rng.random() as each number is consumed
+    """
+    if isinstance(rng, Stream):
+        return rng.uniforms(n).tolist()
+    return iter(rng.random, None)
+
+class Stream(random.Random):
+    """
+    A seedable random stream owned by one patient or trial. It can stand in
+    for the random module (random()) in the virus and patient classes, and
+    for numpy.random (binomial(), multinomial(), poisson()) in the genotype
+    engines, and can also draw uniform numbers in blocks.
+    """
+
+    def __init__(self, seed = None):
+        """
+        Initialization function, seeds both generators of the stream.
+
+        seed: the seed (an integer, usually from streamSeed()), or None to
+        seed from the system
+        """
+        random.Random.__init__(self, seed)
+        self.block = numpy.random.RandomState(self.randrange(2**32))
+
+    def uniforms(self, n):
+        """
+        Draws a block of uniform numbers.
+
+        n: the size of the block (an integer)
+
+        returns: n floats in [0, 1) (a numpy array)
+        """
+        return self.block.random_sample(n)
+
+    def binomial(self, n, p):
+        """
+        Binomial draws, as numpy.random.binomial().
+        """
+        return self.block.binomial(n, p)
+
+    def multinomial(self, n, pvals):
+        """
+        Multinomial draws, as numpy.random.multinomial().
+        """
+        return self.block.multinomial(n, pvals)
+
+    def poisson(self, lam):
+        """
+        Poisson draws, as numpy.random.poisson().
+        """
+        return self.block.poisson(lam)
+
+    def normal(self, loc, scale):
+        """
+        Normal draws, as numpy.random.normal().
+        """
+        return self.block.normal(loc, scale)
+
+    def getstate(self):
+        """
+        Returns the state of both generators, so streams survive copying and
+        pickling to worker processes.
+        """
+        return random.Random.getstate(self), self.block.get_state()
+
+    def setstate(self, state):
+        """
+        Restores a state returned by getstate().
+        """
+        random.Random.setstate(self, state[0])
+        self.block.set_state(state[1])